@@ -0,0 +1,192 @@
+                         ###################
+                        #                  #
+ #######               #  #  #####  #####  #   ###
+#       #      #      #   #     #      #   #  #   #
+ ###     #    # #    #    #    #      #    #  ####
+    #     #  #   #  #     #   #      #     #  #
+####       ##     ##      #  #####  #####  #   ###
+
+
+#############################################
+#                   IMPORTS                 #
+#############################################
+import argparse
+import itertools
+import json
+import time
+
+import numpy as np
+
+from model.inference import load_model, warmup, MODELPATH, BACKENDS
+from preprocessing.gate import FrameGate, ENERGY_THRESHOLD
+from preprocessing.prepro import PreProcessor, AUDIOPATH, LABELPATH
+
+
+#############################################
+#                   CONSTANTS               #
+#############################################
+# recordings of player 05 are not used for tuning, following the usual player-wise split of GuitarSet
+PLAYER = '05'
+ONSET_THRESHOLDS = [0.0, 0.05, 0.1, 0.2, 0.3, 0.5]
+TOLERANCE = 2
+
+
+def tab_events(classes: np.array) -> tuple:
+    """Returns the notes that end up in the tabs: the played strings of every frame that differs from the frame before
+    (the duplicate removal of the PostProcessor).
+
+    Args:
+        classes (np.ndarray): Predicted class per frame and string with shape (TIME, STRINGS), 0 is "not played".
+
+    Returns:
+        tuple: frame, string and class of every note
+    """
+    changed = np.ones(len(classes), dtype=bool)
+    changed[1:] = np.any(classes[1:] != classes[:-1], axis=1)
+    frames, strings = np.nonzero(changed[:, np.newaxis] & (classes > 0))
+
+    return frames, strings, classes[frames, strings]
+
+
+def match_events(reference: tuple, estimate: tuple, tolerance: int = TOLERANCE) -> int:
+    """Counts the notes of the estimate that match a note of the reference on the same string and fret within tolerance frames.
+
+    Args:
+        reference (tuple): Reference notes as returned by tab_events().
+        estimate (tuple): Estimated notes as returned by tab_events().
+        tolerance (int, optional): Maximum distance in frames. Defaults to 2.
+
+    Returns:
+        int: number of matched notes
+    """
+    matches = 0
+
+    for string, fret in set(zip(reference[1], reference[2])):
+        ref = np.sort(reference[0][(reference[1] == string) & (reference[2] == fret)])
+        est = np.sort(estimate[0][(estimate[1] == string) & (estimate[2] == fret)])
+
+        # greedy matching of the sorted onsets
+        i = j = 0
+        while i < len(ref) and j < len(est):
+            if abs(int(ref[i]) - int(est[j])) <= tolerance:
+                matches += 1
+                i += 1
+                j += 1
+            elif est[j] < ref[i]:
+                j += 1
+            else:
+                i += 1
+
+    return matches
+
+
+def f1(reference: tuple, estimate: tuple, tolerance: int = TOLERANCE) -> float:
+    n = len(reference[0]) + len(estimate[0])
+    return 2 * match_events(reference, estimate, tolerance) / n if n else 1.0
+
+
+def benchmark(files: list, model, onset_thresholds: list = ONSET_THRESHOLDS, energy_thresholds: list = [ENERGY_THRESHOLD],
+              p: PreProcessor = None, tolerance: int = TOLERANCE) -> list:
+    """Measures how many frames the FrameGate sends to the model and how much the tabs change for a grid of thresholds.
+
+    Args:
+        files (list): GuitarSet filenames (.jams) to evaluate on.
+        model (keras.Model or TFLiteModel): Loaded swizzle model.
+        onset_thresholds (list, optional): Onset thresholds to evaluate. Defaults to ONSET_THRESHOLDS.
+        energy_thresholds (list, optional): Energy thresholds to evaluate. Defaults to [ENERGY_THRESHOLD].
+        p (PreProcessor, optional): PreProcessor to load the files with. Defaults to None (default paths).
+        tolerance (int, optional): Maximum distance in frames for matching notes. Defaults to 2.
+
+    Returns:
+        list: one result per threshold pair (first without gating) with the share of predicted frames, prediction time,
+              frame accuracy and note F1 against the labels, and note F1 against the tabs without gating
+    """
+    p = p or PreProcessor()
+    configs = [None] + list(itertools.product(energy_thresholds, onset_thresholds))
+    totals = {config: {'frames': 0, 'predicted': 0, 'predict': 0, 'correct': 0, 'matched_labels': 0, 'notes_labels': 0,
+                       'matched_full': 0, 'notes_full': 0} for config in configs}
+
+    for filename in files:
+        audio, labels = p.load_files(filename, rec_mode='mm')
+        p.preprocess_audio(audio, training=True)
+        p.preprocess_labels(labels)
+        data, windows = p.output['data'], p.output['windows']
+
+        truth = np.argmax(p.output['windowlabels'], axis=-1)
+        truth_events = tab_events(truth)
+        full_events = None
+
+        for config in configs:
+            start = time.perf_counter()
+            if config is None:
+                y = model.predict(windows[..., np.newaxis], verbose=0)
+                predicted = len(windows)
+            else:
+                gate = FrameGate(*config)
+                y = gate.predict(model, data, windows)
+                predicted = int(gate.select(data)[0].sum())
+            elapsed = time.perf_counter() - start
+
+            classes = np.argmax(y, axis=-1)
+            events = tab_events(classes)
+            full_events = full_events or events
+
+            t = totals[config]
+            t['frames'] += len(windows)
+            t['predicted'] += predicted
+            t['predict'] += elapsed
+            t['correct'] += int(np.sum(classes == truth))
+            t['matched_labels'] += 2 * match_events(truth_events, events, tolerance)
+            t['notes_labels'] += len(truth_events[0]) + len(events[0])
+            t['matched_full'] += 2 * match_events(full_events, events, tolerance)
+            t['notes_full'] += len(full_events[0]) + len(events[0])
+
+    results = []
+    for config, t in totals.items():
+        results.append({'energy_threshold': None if config is None else config[0],
+                        'onset_threshold': None if config is None else config[1],
+                        'predicted': t['predicted'] / max(t['frames'], 1),
+                        'predict_sec': t['predict'],
+                        'frame_accuracy': t['correct'] / max(t['frames'] * p.n_strings, 1),
+                        'f1_labels': t['matched_labels'] / t['notes_labels'] if t['notes_labels'] else 1.0,
+                        'f1_full': t['matched_full'] / t['notes_full'] if t['notes_full'] else 1.0})
+
+    return results
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Measure the tradeoff between predicted frames and tab accuracy of the frame gate on GuitarSet recordings.")
+    parser.add_argument("--model", default=MODELPATH, help=f"path to the swizzle model (default: {MODELPATH})")
+    parser.add_argument("--backend", default='keras', choices=BACKENDS, help="inference backend (default: keras)")
+    parser.add_argument("--audiopath", default=AUDIOPATH, help=f"GuitarSet audio (default: {AUDIOPATH})")
+    parser.add_argument("--labelpath", default=LABELPATH, help=f"GuitarSet annotations (default: {LABELPATH})")
+    parser.add_argument("--player", default=PLAYER, help=f"evaluate on the recordings of this player (default: {PLAYER})")
+    parser.add_argument("--limit", type=int, default=None, help="maximum number of recordings")
+    parser.add_argument("--onset", type=float, nargs='+', default=ONSET_THRESHOLDS, help=f"onset thresholds (default: {ONSET_THRESHOLDS})")
+    parser.add_argument("--energy", type=float, nargs='+', default=[ENERGY_THRESHOLD], help=f"energy thresholds in dB (default: {ENERGY_THRESHOLD})")
+    parser.add_argument("--tolerance", type=int, default=TOLERANCE, help=f"maximum distance of matching notes in frames (default: {TOLERANCE})")
+    parser.add_argument("--json", help="write report to this file")
+    args = parser.parse_args()
+
+    p = PreProcessor(audiopath=args.audiopath, labelpath=args.labelpath)
+    files = [f for f in p.get_filenames() if f.startswith(args.player)][:args.limit]
+
+    model = load_model(args.model, backend=args.backend)
+    warmup(model)
+
+    results = benchmark(files, model, args.onset, args.energy, p, args.tolerance)
+
+    print(f"{len(files)} recordings, F1 of the notes in the tabs within {args.tolerance} frames")
+    print(f"{'energy':>8s} {'onset':>6s} {'predicted':>10s} {'predict':>9s} {'frame acc':>10s} {'F1 labels':>10s} {'F1 ungated':>11s}")
+    for r in results:
+        gate = ("{:8.0f} {:6.2f}".format(r['energy_threshold'], r['onset_threshold']) if r['onset_threshold'] is not None else f"{'off':>8s} {'-':>6s}")
+        print(f"{gate} {r['predicted']:10.1%} {r['predict_sec']:8.2f}s {r['frame_accuracy']:10.4f} {r['f1_labels']:10.4f} {r['f1_full']:11.4f}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+                         ###################
+                        #                  #
+ #######               #  #  #####  #####  #   ###
+#       #      #      #   #     #      #   #  #   #
+ ###     #    # #    #    #    #      #    #  ####
+    #     #  #   #  #     #   #      #     #  #
+####       ##     ##      #  #####  #####  #   ###
+
+
+#############################################
+#                   IMPORTS                 #
+#############################################
+
+import argparse
+import json
+import multiprocessing
+import os
+
+from benchmarks.training import train, DATASETPATH, MODES, N_TRAIN, N_TEST
+
+
+def run(replicas: list, mode: str = 'float32', dataset_path: str = DATASETPATH, n_train: int = N_TRAIN, n_test: int = N_TEST, epochs: int = 3, batch_size: int = 128) -> dict:
+    """Trains with 1 to N data parallel replicas and measures the throughput. Every run uses a fresh process,
+    because the logical CPU devices of the replicas can only be set up before tensorflow is initialized.
+
+    Args:
+        replicas (list): Numbers of replicas to compare, e.g. [1, 2, 4].
+        mode (str, optional): Training mode, one of MODES. Defaults to 'float32'.
+        dataset_path (str, optional): Path to the dataset. Defaults to DATASETPATH.
+        n_train (int, optional): Maximum number of training windows. Defaults to 20000.
+        n_test (int, optional): Maximum number of test windows. Defaults to 5000.
+        epochs (int, optional): Number of epochs, the first one is not counted in the throughput. Defaults to 3.
+        batch_size (int, optional): Batch size per replica. Defaults to 128.
+
+    Returns:
+        dict: results per number of replicas (see training.train()), with speedup and scaling efficiency relative to 1 replica
+    """
+    report = {}
+    context = multiprocessing.get_context('spawn')
+
+    for n in replicas:
+        with context.Pool(1) as pool:
+            report[n] = pool.apply(train, (mode, dataset_path, n_train, n_test, epochs, batch_size, n))
+
+    baseline = report[min(report)]['samples_per_sec'] / min(report)
+    for n, result in report.items():
+        result['speedup'] = result['samples_per_sec'] / baseline
+        result['efficiency'] = result['speedup'] / n
+
+    return report
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Measure how data parallel training (MirroredStrategy over logical CPU devices) scales with the number of replicas.")
+    parser.add_argument("--replicas", type=int, nargs="+", default=[1, 2, 4, 8], help="numbers of replicas to compare (default: 1 2 4 8)")
+    parser.add_argument("--mode", default='float32', choices=list(MODES), help="training mode (default: float32)")
+    parser.add_argument("--dataset", default=DATASETPATH, help=f"dataset to train and evaluate on (default: {DATASETPATH})")
+    parser.add_argument("--train", type=int, default=N_TRAIN, help=f"maximum number of training windows (default: {N_TRAIN})")
+    parser.add_argument("--test", type=int, default=N_TEST, help=f"maximum number of held-out windows (default: {N_TEST})")
+    parser.add_argument("--epochs", type=int, default=3, help="epochs per run, the first one is not counted in the throughput (default: 3)")
+    parser.add_argument("--batch-size", type=int, default=128, help="batch size per replica (default: 128)")
+    parser.add_argument("--json", help="write report to this file")
+    args = parser.parse_args()
+
+    if args.epochs < 2:
+        parser.error("--epochs has to be at least 2")
+
+    report = run(sorted(args.replicas), args.mode, args.dataset, args.train, args.test, args.epochs, args.batch_size)
+
+    print(f"{os.cpu_count()} CPUs")
+    print(f"{'replicas':>8s} {'batch':>6s} {'samples/s':>10s} {'speedup':>8s} {'efficiency':>11s} {'accuracy':>9s}")
+    for n, result in report.items():
+        print(f"{n:8d} {result['global_batch_size']:6d} {result['samples_per_sec']:10.0f} {result['speedup']:7.2f}x {result['efficiency']:10.0%} {result['accuracy']:9.4f}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+
+if __name__ == "__main__":
+    main()
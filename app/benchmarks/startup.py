@@ -0,0 +1,136 @@
+                         ###################
+                        #                  #
+ #######               #  #  #####  #####  #   ###
+#       #      #      #   #     #      #   #  #   #
+ ###     #    # #    #    #    #      #    #  ####
+    #     #  #   #  #     #   #      #     #  #
+####       ##     ##      #  #####  #####  #   ###
+
+
+#############################################
+#                   IMPORTS                 #
+#############################################
+import argparse
+import ast
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+
+#############################################
+#                   CONSTANTS               #
+#############################################
+APPPATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# entry points: script whose module-level imports are measured, or code to import
+TARGETS = {'frontend': {'script': 'frontend.py'},
+           'transcribe': {'code': 'import transcribe'}}
+
+
+def script_imports(path: str) -> str:
+    """Returns the module-level import statements of a script as code.
+    Scripts like the streamlit frontend can't be imported without running them, their imports are measured instead.
+
+    Args:
+        path (str): Path to the script.
+
+    Returns:
+        str: import statements separated by newlines
+    """
+    with open(path) as f:
+        tree = ast.parse(f.read())
+
+    return "\n".join(ast.unparse(node) for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom)))
+
+
+def measure(code: str) -> dict:
+    """Runs code in a fresh interpreter with -X importtime.
+
+    Args:
+        code (str): Python code to run.
+
+    Returns:
+        dict: total import time in ms and cumulative time in ms per top-level and second-level import
+    """
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], cwd=APPPATH, capture_output=True, text=True)
+
+    if result.returncode != 0:
+        raise RuntimeError(f"Import failed:\n{result.stderr[-2000:]}")
+
+    # lines: "import time: self [us] | cumulative | imported package", nesting is indented by 2 spaces per level
+    modules = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        _, cumulative, package = line[len('import time:'):].split('|')
+        depth = (len(package) - len(package.lstrip()) - 1) // 2
+        if depth <= 1:
+            modules[package.strip()] = (depth, int(cumulative) / 1000)
+
+    return {'total': sum(ms for depth, ms in modules.values() if depth == 0), 'modules': modules}
+
+
+def benchmark(targets: dict = TARGETS, repeat: int = 5, top: int = 10) -> dict:
+    """Measures cold-start import time of the entry points.
+
+    Args:
+        targets (dict, optional): Entry points to measure. Defaults to TARGETS.
+        repeat (int, optional): Number of runs per entry point, the median is reported. Defaults to 5.
+        top (int, optional): Number of slowest top-level imports to report. Defaults to 10.
+
+    Returns:
+        dict: per entry point the median total import time in ms and the slowest top-level imports
+    """
+    report = {}
+
+    # modules imported by the interpreter itself (site, encodings, ...) are not counted
+    startup = set(measure('pass')['modules'])
+
+    for name, target in targets.items():
+        code = target['code'] if 'code' in target else script_imports(os.path.join(APPPATH, target['script']))
+        runs = [measure(code) for _ in range(repeat)]
+        for r in runs:
+            r['modules'] = {m: v for m, v in r['modules'].items() if m not in startup}
+            r['total'] = sum(ms for depth, ms in r['modules'].values() if depth == 0)
+
+        modules = {m: statistics.median(r['modules'].get(m, (0, 0))[1] for r in runs) for m in runs[0]['modules']}
+        report[name] = {'total_ms': statistics.median(r['total'] for r in runs),
+                        'slowest': dict(sorted(modules.items(), key=lambda x: -x[1])[:top])}
+
+    return report
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Measure cold-start import time of the swizzle entry points with python -X importtime.")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per entry point (default: 5)")
+    parser.add_argument("--budget", action='append', default=[], metavar="NAME=MS", help="fail if an entry point takes longer, e.g. frontend=1500")
+    parser.add_argument("--json", help="write report to this file")
+    args = parser.parse_args()
+
+    report = benchmark(repeat=args.repeat)
+
+    for name, result in report.items():
+        print(f"{name}: {result['total_ms']:.0f} ms")
+        for module, ms in result['slowest'].items():
+            print(f"    {ms:8.1f} ms  {module}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    # check budgets
+    failed = False
+    for budget in args.budget:
+        name, ms = budget.split('=')
+        if report[name]['total_ms'] > float(ms):
+            print(f"{name} exceeds budget: {report[name]['total_ms']:.0f} ms > {ms} ms")
+            failed = True
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+                         ###################
+                        #                  #
+ #######               #  #  #####  #####  #   ###
+#       #      #      #   #     #      #   #  #   #
+ ###     #    # #    #    #    #      #    #  ####
+    #     #  #   #  #     #   #      #     #  #
+####       ##     ##      #  #####  #####  #   ###
+
+
+#############################################
+#                   IMPORTS                 #
+#############################################
+import argparse
+import json
+import os
+import statistics
+import time
+
+import numpy as np
+
+from model.inference import load_model, convert_tflite, tflite_filename, TFLiteModel, MODELPATH
+from model.model import split_indices
+from preprocessing.dataset import ShardedDataset
+
+
+#############################################
+#                   CONSTANTS               #
+#############################################
+DATASETPATH = '../data/output/'
+N_CALIBRATION = 500
+N_TEST = 5000
+RSEED = 42
+
+
+def load_split(dataset: ShardedDataset, n_calibration: int = N_CALIBRATION, n_test: int = N_TEST, seed: int = RSEED) -> tuple:
+    """Reads calibration windows from the training split and held-out windows and labels from the test split.
+    The split is the same as the one the model was trained with (see SwizzleModel.data_split()).
+
+    Args:
+        dataset (ShardedDataset): Dataset written by the PreProcessor/Funnel.
+        n_calibration (int, optional): Number of training windows for int8 calibration. Defaults to 500.
+        n_test (int, optional): Maximum number of test windows. Defaults to 5000.
+        seed (int, optional): Seed for sampling the windows. Defaults to RSEED.
+
+    Returns:
+        tuple: calibration windows, test windows, test labels
+    """
+    train_idx, _, test_idx = split_indices(len(dataset))
+    rng = np.random.default_rng(seed)
+
+    calibration_idx = np.sort(rng.choice(train_idx, min(n_calibration, len(train_idx)), replace=False))
+    test_idx = np.sort(rng.choice(test_idx, min(n_test, len(test_idx)), replace=False))
+
+    calibration = dataset.take('windows', calibration_idx)[..., np.newaxis].astype(np.float32)
+    x = dataset.take('windows', test_idx)[..., np.newaxis].astype(np.float32)
+    y = dataset.take('windowlabels', test_idx)
+
+    return calibration, x, y
+
+
+def evaluate(model, x: np.array, y: np.array, reference: np.array = None, batch_size: int = 256, repeat: int = 50) -> dict:
+    """Measures single-window latency, batch throughput and per-string accuracy of a model.
+
+    Args:
+        model (keras.Model or TFLiteModel): swizzle model.
+        x (np.array): Test windows (WINDOWS, BINS, WIDTH, 1).
+        y (np.array): Test labels (WINDOWS, STRINGS, CLASSES).
+        reference (np.array, optional): Predicted classes of the keras model, to measure agreement with. Defaults to None.
+        batch_size (int, optional): Batch size for the throughput measurement. Defaults to 256.
+        repeat (int, optional): Number of single-window predictions for the latency. Defaults to 50.
+
+    Returns:
+        dict: latency in ms, throughput in windows/s, accuracy per string and overall, agreement with the reference
+    """
+    # latency of a single window (e.g. streaming), warm up first
+    model.predict_on_batch(x[:1])
+    latencies = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        model.predict_on_batch(x[i % len(x)][np.newaxis])
+        latencies.append(time.perf_counter() - start)
+
+    # throughput over the whole test set in fixed batches
+    pred = np.empty(y.shape[:2], dtype=np.int64)
+    model.predict_on_batch(x[:batch_size])
+    start = time.perf_counter()
+    for i in range(0, len(x), batch_size):
+        pred[i:i + batch_size] = np.argmax(model.predict_on_batch(x[i:i + batch_size]), axis=-1)
+    duration = time.perf_counter() - start
+
+    correct = pred == np.argmax(y, axis=-1)
+    result = {'latency_ms': statistics.median(latencies) * 1000,
+              'windows_per_sec': len(x) / duration,
+              'accuracy': float(correct.mean()),
+              'string_accuracy': correct.mean(axis=0).tolist(),
+              'classes': pred}
+
+    if reference is not None:
+        result['agreement'] = float((pred == reference).mean())
+
+    return result
+
+
+def benchmark(model_path: str = MODELPATH, dataset_path: str = DATASETPATH, n_calibration: int = N_CALIBRATION, n_test: int = N_TEST, batch_size: int = 256) -> dict:
+    """Converts the keras model to float16 and int8 TFLite models and compares all three on held-out data.
+
+    Args:
+        model_path (str, optional): Path to the SavedModel. Defaults to MODELPATH.
+        dataset_path (str, optional): Path to the dataset. Defaults to DATASETPATH.
+        n_calibration (int, optional): Number of training windows for int8 calibration. Defaults to 500.
+        n_test (int, optional): Maximum number of test windows. Defaults to 5000.
+        batch_size (int, optional): Batch size for the throughput measurement. Defaults to 256.
+
+    Returns:
+        dict: results per backend (see evaluate()) and size of the model files in MiB
+    """
+    calibration, x, y = load_split(ShardedDataset(dataset_path), n_calibration, n_test)
+
+    keras_model = load_model(model_path)
+    report = {'keras': evaluate(keras_model, x, y, batch_size=batch_size)}
+    reference = report['keras']['classes']
+
+    for quantization in ['float16', 'int8']:
+        path = convert_tflite(keras_model, tflite_filename(model_path, quantization), quantization, calibration)
+        report[f'tflite-{quantization}'] = evaluate(TFLiteModel(path, batch_size=batch_size), x, y, reference, batch_size)
+        report[f'tflite-{quantization}']['size_mb'] = os.path.getsize(path) / 2**20
+
+    for result in report.values():
+        del result['classes']
+
+    return report
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Convert the swizzle model to TFLite (float16, int8) and compare it to the keras model on held-out data.")
+    parser.add_argument("--model", default=MODELPATH, help=f"SavedModel to convert (default: {MODELPATH})")
+    parser.add_argument("--dataset", default=DATASETPATH, help=f"dataset for calibration and evaluation (default: {DATASETPATH})")
+    parser.add_argument("--calibration", type=int, default=N_CALIBRATION, help=f"training windows for int8 calibration (default: {N_CALIBRATION})")
+    parser.add_argument("--test", type=int, default=N_TEST, help=f"maximum number of held-out windows (default: {N_TEST})")
+    parser.add_argument("--batch-size", type=int, default=256, help="batch size for the throughput (default: 256)")
+    parser.add_argument("--json", help="write report to this file")
+    args = parser.parse_args()
+
+    report = benchmark(args.model, args.dataset, args.calibration, args.test, args.batch_size)
+
+    print(f"{'backend':16s} {'latency':>10s} {'windows/s':>10s} {'accuracy':>9s} {'agreement':>10s}   accuracy per string (E A D G B e)")
+    for backend, result in report.items():
+        agreement = f"{result['agreement']:10.4f}" if 'agreement' in result else f"{'-':>10s}"
+        strings = " ".join(f"{a:.3f}" for a in result['string_accuracy'])
+        print(f"{backend:16s} {result['latency_ms']:8.2f}ms {result['windows_per_sec']:10.0f} {result['accuracy']:9.4f} {agreement}   {strings}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+                         ###################
+                        #                  #
+ #######               #  #  #####  #####  #   ###
+#       #      #      #   #     #      #   #  #   #
+ ###     #    # #    #    #    #      #    #  ####
+    #     #  #   #  #     #   #      #     #  #
+####       ##     ##      #  #####  #####  #   ###
+
+
+#############################################
+#                   IMPORTS                 #
+#############################################
+
+import argparse
+import json
+import tempfile
+import time
+
+import numpy as np
+import tensorflow as tf
+
+from model.model import SwizzleModel, RSEED
+
+
+#############################################
+#                   CONSTANTS               #
+#############################################
+DATASETPATH = '../data/output/'
+MODES = {'float32': {},
+         'xla': {'JIT_COMPILE': True},
+         'bfloat16': {'MIXED_PRECISION': True},
+         'bfloat16+xla': {'MIXED_PRECISION': True, 'JIT_COMPILE': True}}
+N_TRAIN = 20000
+N_TEST = 5000
+
+
+class EpochTimer(tf.keras.callbacks.Callback):
+    """Records the wall time of every epoch."""
+
+    def on_train_begin(self, logs=None):
+        self.times = []
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self.start = time.perf_counter()
+
+    def on_epoch_end(self, epoch, logs=None):
+        self.times.append(time.perf_counter() - self.start)
+
+
+def train(mode: str, dataset_path: str = DATASETPATH, n_train: int = N_TRAIN, n_test: int = N_TEST, epochs: int = 3, batch_size: int = 128, n_replicas: int = 1) -> dict:
+    """Trains a new swizzle model on a sample of the training split and evaluates it on a sample of the test split.
+
+    Args:
+        mode (str): Training mode, one of MODES.
+        dataset_path (str, optional): Path to the dataset. Defaults to DATASETPATH.
+        n_train (int, optional): Maximum number of training windows. Defaults to 20000.
+        n_test (int, optional): Maximum number of test windows. Defaults to 5000.
+        epochs (int, optional): Number of epochs, at least 2 (the first one includes tracing and compilation). Defaults to 3.
+        batch_size (int, optional): Batch size per replica. Defaults to 128.
+        n_replicas (int, optional): Number of data parallel replicas on logical CPU devices, see cpu_strategy(). Defaults to 1.
+
+    Returns:
+        dict: policy, number of replicas, global batch size, time of the first epoch, samples/sec of the following epochs, final loss, accuracy per string and overall
+    """
+    with tempfile.TemporaryDirectory() as save_path:
+        m = SwizzleModel(BATCH_SIZE=batch_size, EPOCHS=epochs, INPUTPATH=dataset_path, save_path=save_path + '/', N_REPLICAS=n_replicas, verbose=2, **MODES[mode])
+
+    # every mode starts from the same weights and sees the same samples
+    tf.keras.utils.set_random_seed(RSEED)
+    rng = np.random.default_rng(RSEED)
+    train_idx = np.sort(rng.choice(m.train_idx, min(n_train, len(m.train_idx)), replace=False))
+    test_idx = np.sort(rng.choice(m.test_idx, min(n_test, len(m.test_idx)), replace=False))
+
+    m.cnn_swizzle_model()
+    m.compile_model()
+
+    timer = EpochTimer()
+    history = m.swizzle_model.fit(m.make_dataset(train_idx, shuffle=True), epochs=epochs, verbose=0, callbacks=[timer])
+
+    y = m.dataset.take('windowlabels', test_idx)
+    pred = np.argmax(m.swizzle_model.predict(m.make_dataset(test_idx, labels=False), verbose=0), axis=-1)
+    correct = pred == np.argmax(y, axis=-1)
+
+    return {'policy': m.POLICY,
+            'jit_compile': m.JIT_COMPILE,
+            'replicas': m.N_REPLICAS,
+            'global_batch_size': m.GLOBAL_BATCH_SIZE,
+            'first_epoch_s': timer.times[0],
+            'samples_per_sec': len(train_idx) * (epochs - 1) / sum(timer.times[1:]),
+            'loss': history.history['loss'][-1],
+            'accuracy': float(correct.mean()),
+            'string_accuracy': correct.mean(axis=0).tolist()}
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Compare training throughput and accuracy of the float32, XLA and mixed bfloat16 training modes.")
+    parser.add_argument("--dataset", default=DATASETPATH, help=f"dataset to train and evaluate on (default: {DATASETPATH})")
+    parser.add_argument("--modes", nargs="+", default=list(MODES), choices=list(MODES), help="training modes to compare (default: all)")
+    parser.add_argument("--train", type=int, default=N_TRAIN, help=f"maximum number of training windows (default: {N_TRAIN})")
+    parser.add_argument("--test", type=int, default=N_TEST, help=f"maximum number of held-out windows (default: {N_TEST})")
+    parser.add_argument("--epochs", type=int, default=3, help="epochs per mode, the first one is not counted in the throughput (default: 3)")
+    parser.add_argument("--batch-size", type=int, default=128, help="batch size (default: 128)")
+    parser.add_argument("--json", help="write report to this file")
+    args = parser.parse_args()
+
+    if args.epochs < 2:
+        parser.error("--epochs has to be at least 2")
+
+    report = {mode: train(mode, args.dataset, args.train, args.test, args.epochs, args.batch_size) for mode in args.modes}
+
+    print(f"{'mode':14s} {'policy':16s} {'1st epoch':>10s} {'samples/s':>10s} {'speedup':>8s} {'loss':>8s} {'accuracy':>9s}   accuracy per string (E A D G B e)")
+    baseline = next(iter(report.values()))['samples_per_sec']
+    for mode, result in report.items():
+        strings = " ".join(f"{a:.3f}" for a in result['string_accuracy'])
+        print(f"{mode:14s} {result['policy']:16s} {result['first_epoch_s']:9.1f}s {result['samples_per_sec']:10.0f} {result['samples_per_sec'] / baseline:7.2f}x "
+              f"{result['loss']:8.4f} {result['accuracy']:9.4f}   {strings}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+
+if __name__ == "__main__":
+    main()
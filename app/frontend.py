@@ -13,17 +13,12 @@
 
 
 # ---------- python packages ----------
+# heavy packages (librosa, tensorflow) are imported where they are used
 import streamlit as st
-import pandas as pd
-import plotly.express as px
-import numpy as np
 import math
-import librosa
-from tensorflow import keras  
-
-# ---------- swizzle packages ----------
-from preprocessing.prepro import PreProcessor
-from postprocessing.postpro import PostProcessor
+import time
+import io
+import os
 
 # ---------- Page layout ----------
 st.set_page_config(layout='wide',
@@ -35,8 +30,10 @@ st.set_page_config(layout='wide',
 # ----------Setup state session in streamlit----------
 if "page" not in st.session_state: st.session_state['page'] = 0
 if "audiofile" not in st.session_state: st.session_state['audiofile'] = None
-if "X" not in st.session_state: st.session_state['X'] = None
-if "y_pred" not in st.session_state: st.session_state['y_pred'] = None
+if "job" not in st.session_state: st.session_state['job'] = None
+if "tab_pages" not in st.session_state: st.session_state['tab_pages'] = {}
+if "tab_text" not in st.session_state: st.session_state['tab_text'] = {}
+if "result_key" not in st.session_state: st.session_state['result_key'] = None
 if "tabs" not in st.session_state: st.session_state['tabs'] = None
 
 
@@ -49,6 +46,38 @@ def restart():
     st.session_state.page = 0
 
 
+# ---------- Model and postprocessor (shared by all sessions of the server process) ----------
+# one model per inference backend ('keras', 'tflite-float16', 'tflite-int8')
+@st.experimental_singleton(show_spinner=False)
+def get_model(backend: str = 'keras'):
+    from model.inference import load_model, warmup
+
+    start = time.perf_counter()
+    swizzle_model = load_model(backend=backend)
+    load_time = time.perf_counter() - start
+
+    return swizzle_model, {'load': load_time, 'warmup': warmup(swizzle_model)}
+
+# tabs of recordings transcribed before, by any session, with the same model
+@st.experimental_singleton(show_spinner=False)
+def get_resultcache(backend: str = 'keras'):
+    from model.inference import model_version
+    from postprocessing.resultcache import ResultCache
+    return ResultCache(model_version(backend=backend))
+
+# stages of all jobs and sessions are profiled if SWIZZLE_PROFILE is set to the path of the profile (*.json or Prometheus text)
+@st.experimental_singleton(show_spinner=False)
+def get_profiler():
+    from profiling import Profiler
+    return Profiler() if os.environ.get('SWIZZLE_PROFILE') else None
+
+# transcriptions of all sessions run on a bounded pool of worker threads
+@st.experimental_singleton(show_spinner=False)
+def get_jobqueue():
+    from jobs import JobQueue
+    return JobQueue(profiler=get_profiler())
+
+
 # ---------- Swizzle Logo ----------
 l, c, r = st.columns([5,10,2])
 with c:
@@ -71,6 +100,17 @@ with st.sidebar:
     l, c, r = st.columns([1, 4, 1])
     with c:
         back_button_placeholder = st.empty()
+    st.write("")
+    backend = st.selectbox("Inference backend", ['keras', 'tflite-float16', 'tflite-int8'], help="TFLite backends run a quantized model, which is faster on CPUs.")
+    gating = st.checkbox("Skip silent and sustained frames", help="Only frames with an onset are sent to the model, which is faster but can miss soft notes.")
+    onset_threshold = st.slider("Onset threshold", 0.0, 1.0, 0.1, 0.05, disabled=not gating, help="Lower values send more frames to the model.")
+
+# load and warm up model once per server process and backend, before the first upload
+with st.spinner('🔮 waking up swizzle...'):
+    swizzle_model, model_timings = get_model(backend)
+
+with st.sidebar:
+    st.caption(f"Model loaded in {model_timings['load']:.1f}s, warmed up in {model_timings['warmup']:.1f}s (once per server).")
 
 # ----------------------------- Page 1 (Home) -------------------------------
 if st.session_state.page == 0:
@@ -100,34 +140,72 @@ if st.session_state.page == 0:
                     st.error("You forgot to upload your recording! Nothing to swizzle here... :(", icon="🤖")
 
                 else:
-                    #----- Swizzle Spinner ------
-                    with st.spinner('🔮 swizzling it...'):
-                    
-                        #----------- Pre-Processing -----------
-                        p = PreProcessor()
-                        audio, _ = librosa.load(audio_file, sr=22050, dtype=np.float32)
-                        p.preprocess_audio(audio, training=True)
-                        X = p.output['windows']
-
-                        # Store preprocessed data
-                        st.session_state['X'] = X
-
-                        #----------- Loading the model -----------
-                        swizzle_model = keras.models.load_model("../app/model/swizzle_model", compile=False)
-                        y_pred = swizzle_model.predict(st.session_state['X'])
-                        st.session_state['y_pred'] = y_pred
-
-                        #----------- Post-Processing -----------
-                        postpro = PostProcessor()
-                        post_pro_output = postpro.postprocess_data(y_pred, remove_duplicates=True)
-                        st.session_state['tabs'] = post_pro_output
-
-                    #----------- get guitar tabs -----------
-                    nextpage()
+                    from jobs import QueueFull
+                    from preprocessing.gate import FrameGate
+                    from transcribe import transcribe, result_key
+
+                    gate = FrameGate(onset_threshold=onset_threshold) if gating else None
+                    resultcache = get_resultcache(backend)
+
+                    #----------- Tabs of a recording swizzled before -----------
+                    st.session_state['result_key'] = result_key(io.BytesIO(audio_file.getvalue()), resultcache, gate)
+                    tabs = resultcache.get_tabs(st.session_state['result_key'])
+                    if tabs is not None:
+                        st.session_state['tabs'] = tabs
+                        st.session_state['tab_pages'] = {}
+                        nextpage()
+
+                    #----------- Submit transcription (preprocessing, prediction, postprocessing) -----------
+                    try:
+                        job = get_jobqueue().submit(transcribe, io.BytesIO(audio_file.getvalue()), swizzle_model, gate, cache=resultcache)
+                        st.session_state['job'] = job.id
+                    except QueueFull:
+                        st.error("swizzle is busy right now, please try again in a minute.", icon="🤖")
+
+            #----- Progress of the transcription ------
+            if st.session_state['job'] is not None:
+                jobqueue = get_jobqueue()
+                job = jobqueue.get(st.session_state['job'])
+
+                if job is None:
+                    st.session_state['job'] = None
+
+                elif not job.done:
+                    # show the progress once and poll again in a new run, so the script thread isn't blocked by the job
+                    if job.status == 'queued':
+                        st.write(f"🔮 waiting for swizzle ({jobqueue.position(job)} ahead of you)...")
+                    else:
+                        st.write(f"🔮 swizzling it: {job.stage}...")
+                    st.progress(int(job.progress * 100))
+                    time.sleep(0.5)
+                    st.experimental_rerun()
+
+                else:
+                    status = st.empty()
+                    jobqueue.pop(job.id)
+                    st.session_state['job'] = None
+
+                    if get_profiler() is not None:
+                        get_profiler().write(os.environ['SWIZZLE_PROFILE'])
+
+                    if job.status == 'failed':
+                        status.error(f"Something went wrong while swizzling your recording: {job.error}", icon="🤖")
+                    else:
+                        st.session_state['tabs'] = job.result
+                        st.session_state['tab_pages'] = {}
+
+                        #----------- get guitar tabs -----------
+                        nextpage()
                      
 # -----------------------------Page 2 (Guitar tabs)-------------------------------     
 elif st.session_state.page == 1:
 
+    from postprocessing.render import render_svg, render_text
+    from profiling import activate
+
+    # positions of the tabs shown at once, 10 per line
+    POSITIONS_PER_PAGE = 80
+
     with st.sidebar:
         with back_button_placeholder.container():
             st.button("← go back home", on_click=restart)
@@ -148,66 +226,32 @@ elif st.session_state.page == 1:
             if st.session_state['audiofile']:
                 st.write("Song: ", st.session_state['audiofile'].name)
 
-        # ----------Setup variables for the for-loop----------
-        n_tabs = st.session_state['tabs'].shape[0]/10
-        n_tabs = math.ceil(n_tabs)
-        u_bound= 10
-        l_bound= 0
-        df = pd.DataFrame(st.session_state['tabs'], columns=["pos", "string", "fret"])
+        # ----------Setup pages of the tabs----------
+        tabs = st.session_state['tabs']
+        n_positions = int(tabs[:, 0].max()) + 1 if len(tabs) else 0
+        n_pages = max(1, math.ceil(n_positions / POSITIONS_PER_PAGE))
 
         # -----Page layout and session state------
         st.write("---")
         l, c, r = st.columns([2, 10, 2])
         with c:
             st.write('### Guitar tabs')
-        
-        # ----------Show guitar tabs using plotly express scatter plot----------
-
-            for i in range(n_tabs):    
-                # get next 10 notes
-                tab = df[l_bound:u_bound].reset_index(drop=True)
-                l_bound += 10
-                u_bound += 10
-
-                # pad tab if less than 10 notes
-                if tab.shape[0] < 10:
-                    # get padding needed
-                    pad = 10 - tab.shape[0]
-                    # get last position in tab
-                    last_pos = tab.iloc[-1, 0]
-                    # calculate next positions needed
-                    next_pos = list(range(last_pos+1, last_pos+pad+1))
-                    # construct filler with empty frets
-                    filler = pd.DataFrame(np.transpose([next_pos, [''] * pad, [1] * pad]), columns=['pos', 'fret', 'string'])
-                    tab = pd.concat([tab, filler], axis=0).reset_index(drop=True)
-
-                # create scatter plot
-                fig = px.scatter(tab, y="string", x="pos", text='fret', height=275, labels={"string": "","pos": ""})
-
-                # style scatter plot
-                fig.update_traces(marker_size=20, textposition="middle center", marker=dict(color='White'))
-                fig.update_yaxes(showgrid=False)
-                fig.update_xaxes(showgrid=False, showticklabels=False)
-                fig.update_layout(font=dict(family="Arial", size=18, color="Black"),
-                                  showlegend=False, paper_bgcolor='white', plot_bgcolor='white',
-                                  margin=dict(l=0, r=30, t=50, b=50),
-                                  xaxis=dict(tickfont = dict(size=20, color="black")),
-                                  yaxis=dict(tickfont = dict(size=20, color="black"), tickvals=[0, 1, 2, 3, 4, 5], ticktext=["E", "A", "D", "G", "B", "e"]))
-                for i in range(6):
-                    fig.add_hline(y=i,line_width=1)
-                
-                # add "TAB"
-                tab = ['T', 'A', 'B']
-                for idx, t in enumerate(tab):
-                    fig.add_annotation(dict(font=dict(color='black',size=20),
-                                                x=0,
-                                                y=-idx+3.5,
-                                                showarrow=False,
-                                                text=t,
-                                                textangle=0,
-                                                xanchor='left',
-                                                xref="paper",
-                                                yref="y"))
-
-                # print the chart
-                st.plotly_chart(fig, use_container_width=True)
\ No newline at end of file
+
+            if n_pages > 1:
+                tab_page = st.number_input(f"Page (of {n_pages})", min_value=1, max_value=n_pages, value=1, step=1)
+            else:
+                tab_page = 1
+
+        # ----------Show guitar tabs as one SVG image per page, every page and the text tabs are rendered once per session----------
+            with activate(get_profiler(), request='render'):
+                if tab_page not in st.session_state['tab_pages']:
+                    first = (tab_page - 1) * POSITIONS_PER_PAGE
+                    st.session_state['tab_pages'][tab_page] = render_svg(tabs, first, min(first + POSITIONS_PER_PAGE, n_positions), positions_per_line=10)
+                if st.session_state['result_key'] not in st.session_state['tab_text']:
+                    st.session_state['tab_text'] = {st.session_state['result_key']: render_text(tabs)}
+            text = st.session_state['tab_text'][st.session_state['result_key']]
+
+            st.markdown(st.session_state['tab_pages'][tab_page], unsafe_allow_html=True)
+
+            st.write("")
+            st.download_button("Download tabs", text, file_name="swizzle_tabs.txt")
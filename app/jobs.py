@@ -0,0 +1,177 @@
+                         ###################
+                        #                  #
+ #######               #  #  #####  #####  #   ###
+#       #      #      #   #     #      #   #  #   #
+ ###     #    # #    #    #    #      #    #  ####
+    #     #  #   #  #     #   #      #     #  #
+####       ##     ##      #  #####  #####  #   ###
+
+
+#############################################
+#                   IMPORTS                 #
+#############################################
+import itertools
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from profiling import Profiler, activate
+
+
+#############################################
+#                   CONSTANTS               #
+#############################################
+WORKERS = 2
+MAX_QUEUED = 8
+JOB_TTL = 600
+
+
+class QueueFull(RuntimeError):
+    """Raised when a job is submitted while the queue is saturated."""
+
+
+class Job:
+
+    def __init__(self, job_id: int) -> None:
+        """State of a job, updated by the worker thread and read by the frontend.
+
+        Args:
+            job_id (int): Id of the job.
+        """
+        self.id = job_id
+        self.status = 'queued'          # queued, running, done or failed
+        self.stage = 'queued'
+        self.progress = 0.0
+        self.result = None
+        self.error = None
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+
+
+    def update(self, stage: str, progress: float):
+        """Progress callback for the job function.
+
+        Args:
+            stage (str): Name of the current stage.
+            progress (float): Progress of the whole job in [0, 1].
+        """
+        self.stage = stage
+        self.progress = progress
+
+
+    @property
+    def done(self) -> bool:
+        return self.status in ('done', 'failed')
+
+
+class JobQueue:
+
+    def __init__(self, workers: int = WORKERS, max_queued: int = MAX_QUEUED, ttl: float = JOB_TTL, profiler: Profiler = None, verbose: int = 0) -> None:
+        """Runs jobs on a bounded pool of worker threads. Jobs that don't fit into the pool and the queue are rejected,
+        so the waiting time of accepted jobs stays bounded when many users submit at once.
+
+        Threads share the model loaded once per server process. Most of the work (CQT, prediction) runs in numpy,
+        librosa and tensorflow code that releases the GIL.
+
+        Args:
+            workers (int, optional): Number of jobs running at the same time. Defaults to 2.
+            max_queued (int, optional): Number of jobs waiting for a worker, more are rejected. Defaults to 8.
+            ttl (float, optional): Seconds after which finished jobs nobody picked up are removed. Defaults to 600.
+            profiler (Profiler, optional): Profiler to record the stages of every job in, labeled with the job id. Defaults to None.
+            verbose (int, optional): Verbosity level of logger. Defaults to 0.
+        """
+        self.workers = workers
+        self.max_queued = max_queued
+        self.ttl = ttl
+        self.profiler = profiler
+
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='swizzle-job')
+        self.jobs = {}
+        self.lock = threading.Lock()
+        self.ids = itertools.count()
+
+        # setup logger
+        FORMAT = "[%(levelname)8s][%(filename)s:%(lineno)4s - %(funcName)20s() ] %(message)s"
+        logging.basicConfig(format=FORMAT)
+        verbosity = {0: logging.CRITICAL, 1: logging.ERROR, 2: logging.WARNING, 3: logging.INFO, 4: logging.DEBUG}
+        self.logger = logging.getLogger(__name__)
+        self.logger.setLevel(verbosity[verbose])
+
+
+    def submit(self, fn, *args, **kwargs) -> Job:
+        """Submits a job. fn is called in a worker thread as fn(*args, progress=job.update, **kwargs).
+
+        Args:
+            fn (callable): Job function, its return value is stored in job.result.
+
+        Raises:
+            QueueFull: if all workers are busy and max_queued jobs are waiting.
+
+        Returns:
+            Job: the submitted job
+        """
+        with self.lock:
+            self._cleanup()
+
+            stats = self.stats()
+            if stats['queued'] + stats['running'] >= self.workers + self.max_queued:
+                raise QueueFull(f"{self.workers} jobs running and {self.max_queued} jobs queued.")
+
+            job = Job(next(self.ids))
+            self.jobs[job.id] = job
+
+        self.executor.submit(self._run, job, fn, args, kwargs)
+        self.logger.info(f"Submitted job {job.id}.")
+        return job
+
+
+    def get(self, job_id: int) -> Job:
+        """Returns the job with the given id, None if it doesn't exist (anymore)."""
+        return self.jobs.get(job_id)
+
+
+    def pop(self, job_id: int) -> Job:
+        """Returns and removes a job, e.g. after its result was picked up."""
+        with self.lock:
+            return self.jobs.pop(job_id, None)
+
+
+    def position(self, job: Job) -> int:
+        """Returns the number of queued jobs submitted before the given job."""
+        return sum(1 for j in list(self.jobs.values()) if j.status == 'queued' and j.id < job.id)
+
+
+    def stats(self) -> dict:
+        """Returns the number of queued, running and finished jobs."""
+        statuses = [j.status for j in list(self.jobs.values())]
+        return {'queued': statuses.count('queued'), 'running': statuses.count('running'),
+                'finished': statuses.count('done') + statuses.count('failed')}
+
+
+    def _run(self, job: Job, fn, args: tuple, kwargs: dict):
+        job.status = 'running'
+        job.started = time.time()
+        self.logger.info(f"Started job {job.id} after {job.started - job.submitted:.1f}s in the queue.")
+
+        try:
+            with activate(self.profiler, request=job.id):
+                job.result = fn(*args, progress=job.update, **kwargs)
+            job.update('done', 1.0)
+            job.status = 'done'
+        except Exception as e:
+            self.logger.error(f"Job {job.id} failed: {e}")
+            job.error = e
+            job.status = 'failed'
+
+        job.finished = time.time()
+        self.logger.info(f"Finished job {job.id} in {job.finished - job.started:.1f}s.")
+
+
+    def _cleanup(self):
+        # remove finished jobs of sessions that went away
+        now = time.time()
+        for job_id, job in list(self.jobs.items()):
+            if job.done and now - job.finished > self.ttl:
+                del self.jobs[job_id]
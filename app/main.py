@@ -12,12 +12,15 @@
 #############################################
 from preprocessing.funnel import Funnel
 from preprocessing.prepro import PreProcessor
+from preprocessing.featurestore import FeatureStore
+from profiling import Profiler
 
 import os
 import datetime
 import logging
 
-def generate_training_data(verbose: int = 0, r: bool = False, save: bool = True, rec_modes: list = ['all'], subset: float = 1, filter: str = None, remove_noise: float = 0.95):
+def generate_training_data(verbose: int = 0, r: bool = False, save: bool = True, rec_modes: list = ['all'], subset: float = 1, filter: str = None, remove_noise: float = 0.95,
+                           profile: str = None):
     """Generates Preprocessor and Funnel objects to process the dataset. Returns training data.
 
     Args:
@@ -26,6 +29,7 @@ def generate_training_data(verbose: int = 0, r: bool = False, save: bool = True,
         save (bool, optional): Wheter to save the data generated (*.npz). Defaults to True.
         subset (float, optional): What fraction of the data to use (0-1). Defaults to 1 (all data).
         filter (str, optional): Filter the data (e.g. "solo" or "comp"). Defaults to None
+        profile (str, optional): Write wall time, CPU time and peak memory per stage and file to this path (.json, otherwise Prometheus text format). Defaults to None (no profiling).
     """
 
     start_time = datetime.datetime.now()
@@ -46,19 +50,23 @@ def generate_training_data(verbose: int = 0, r: bool = False, save: bool = True,
         logger.info("-"*50)
         logger.info(f"Settings are Return: {r}, Save: {save}, Recording modes: {rec_modes}, Subset: {subset}, Filter: {filter}, Remove noise: {remove_noise}")
 
-        p = PreProcessor(verbose=verbose)
-        f = Funnel(p, verbose=verbose, f=filter)
+        # CQTs are cached, so runs that only change post-CQT settings skip decoding and CQT
+        p = PreProcessor(verbose=verbose, store=FeatureStore(verbose=verbose))
+        profiler = Profiler() if profile else None
+        f = Funnel(p, verbose=verbose, f=filter, profiler=profiler)
 
         if r == False and save == False:
             logger.info("Data will neither be returned nor saved. Maybe your forgot to set your output (parameters r and/or save)?")
 
+        data = f.get_training_data(r=r, save=save, rec_modes=rec_modes, subset=subset, filter=filter, remove_noise=remove_noise)
+
+        if profiler is not None:
+            profiler.write(profile)
+            logger.info(f"Wrote profile to {profile}.")
+
         # if data should be returned, return function's return
         if r:
-            return f.get_training_data(r=r, save=save, rec_modes=rec_modes, subset=subset, filter=filter, remove_noise=remove_noise)
-        
-        # else just save the files
-        else:
-            f.get_training_data(r=r, save=save, rec_modes=rec_modes, subset=subset, filter=filter, remove_noise=remove_noise)
+            return data
 
         logger.info("-"*50)
         logger.info("Finished training data generation.")
@@ -74,7 +82,7 @@ def generate_training_data(verbose: int = 0, r: bool = False, save: bool = True,
         if "app" in os.listdir(cwd):
             os.chdir("app")
             logger.warning(f"Success!")
-            generate_training_data(verbose=verbose, r=r, save=save, rec_modes=rec_modes, subset=subset, filter=filter, remove_noise=remove_noise)
+            generate_training_data(verbose=verbose, r=r, save=save, rec_modes=rec_modes, subset=subset, filter=filter, remove_noise=remove_noise, profile=profile)
 
         else:
             logger.warning("Couldn't find \"app\" directory. Please change to it manually")
@@ -90,8 +98,9 @@ if __name__ == "__main__":
     subset = 1          # 0-1: fraction of data to sample
     filter = 'solo'     # solo, comp, empty: song modes to consider. Empty string means take all.
     remove_noise = 0    # 0-1: fraction of empty frames to remove.
+    profile = None      # path of the per-stage profile (*.json or Prometheus text), None: no profiling.
 
 
     ############### FUNCTION CALL #####################
 
-    generate_training_data(verbose=verbose, r=r, save=save, rec_modes=rec_modes, subset=subset, filter=filter, remove_noise=remove_noise)
\ No newline at end of file
+    generate_training_data(verbose=verbose, r=r, save=save, rec_modes=rec_modes, subset=subset, filter=filter, remove_noise=remove_noise, profile=profile)
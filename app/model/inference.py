@@ -0,0 +1,211 @@
+                         ###################
+                        #                  #
+ #######               #  #  #####  #####  #   ###
+#       #      #      #   #     #      #   #  #   #
+ ###     #    # #    #    #    #      #    #  ####
+    #     #  #   #  #     #   #      #     #  #
+####       ##     ##      #  #####  #####  #   ###
+
+
+#############################################
+#                   IMPORTS                 #
+#############################################
+import numpy as np
+import hashlib
+import os
+import time
+import logging
+import threading
+
+
+#############################################
+#                   CONSTANTS               #
+#############################################
+MODELPATH = '../app/model/swizzle_model'
+BACKENDS = ['keras', 'tflite-float16', 'tflite-int8']
+
+
+def load_model(path: str = MODELPATH, backend: str = 'keras'):
+    """Loads the trained swizzle model for inference.
+    tensorflow is imported here and not at module level, so that importing this module stays cheap.
+
+    The TFLite backends load <path>_float16.tflite or <path>_int8.tflite. The float16 model is converted
+    from the SavedModel if it doesn't exist yet, the int8 model needs calibration data and has to be
+    converted beforehand (see convert_tflite() and benchmarks/tflite.py).
+
+    Args:
+        path (str, optional): Path to the SavedModel. Defaults to '../app/model/swizzle_model'.
+        backend (str, optional): One of 'keras', 'tflite-float16' or 'tflite-int8'. Defaults to 'keras'.
+
+    Returns:
+        keras.Model or TFLiteModel: swizzle model (not compiled)
+    """
+    logger = logging.getLogger(__name__)
+
+    if backend == 'keras':
+        from tensorflow import keras
+        from model import layers  # registers the custom layer and loss of the model
+
+        logger.info(f"Loading model from {path}.")
+        return keras.models.load_model(path, compile=False)
+
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend {backend}, expected one of {BACKENDS}.")
+
+    quantization = backend.split('-')[1]
+    tflite_path = tflite_filename(path, quantization)
+
+    if not os.path.exists(tflite_path):
+        if quantization == 'int8':
+            raise FileNotFoundError(f"{tflite_path} not found. int8 models need calibration data, convert it with benchmarks/tflite.py first.")
+        convert_tflite(load_model(path), tflite_path, quantization)
+
+    logger.info(f"Loading model from {tflite_path}.")
+    return TFLiteModel(tflite_path)
+
+
+def warmup(model, batch_size: int = 32) -> float:
+    """Runs a batch of zeros through the model, so that graph tracing happens before the first real prediction.
+
+    Args:
+        model (keras.Model or TFLiteModel): Loaded swizzle model.
+        batch_size (int, optional): Size of the dummy batch. Defaults to 32.
+
+    Returns:
+        float: Warmup time in seconds.
+    """
+    start = time.perf_counter()
+    model.predict(np.zeros((batch_size, *model.input_shape[1:]), dtype=np.float32), verbose=0)
+
+    return time.perf_counter() - start
+
+
+def model_version(path: str = MODELPATH, backend: str = 'keras') -> str:
+    """Returns a hash of the model files, which changes whenever the model is retrained or converted again.
+
+    Args:
+        path (str, optional): Path to the SavedModel. Defaults to '../app/model/swizzle_model'.
+        backend (str, optional): One of 'keras', 'tflite-float16' or 'tflite-int8'. Defaults to 'keras'.
+
+    Returns:
+        str: sha1 hexdigest of the backend and the content of the model files
+    """
+    if backend != 'keras':
+        path = tflite_filename(path, backend.split('-')[1])
+
+    if os.path.isdir(path):
+        files = sorted(os.path.join(root, f) for root, _, names in os.walk(path) for f in names)
+    else:
+        files = [path]
+
+    h = hashlib.sha1(backend.encode())
+    for file in files:
+        h.update(os.path.relpath(file, path).encode())
+        with open(file, 'rb') as f:
+            for block in iter(lambda: f.read(2**20), b''):
+                h.update(block)
+
+    return h.hexdigest()
+
+
+def tflite_filename(path: str, quantization: str) -> str:
+    return path.rstrip('/') + f'_{quantization}.tflite'
+
+
+def convert_tflite(model, path: str, quantization: str = 'float16', calibration: np.array = None) -> str:
+    """Converts a keras model to TFLite with post-training quantization.
+
+    Args:
+        model (keras.Model): swizzle model.
+        path (str): Path of the .tflite file.
+        quantization (str, optional): 'float16' (weights) or 'int8' (weights and activations). Defaults to 'float16'.
+        calibration (np.array, optional): Windows to calibrate the int8 activation ranges with, e.g. a few hundred training windows.
+
+    Returns:
+        str: path of the .tflite file
+    """
+    import tensorflow as tf
+
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+
+    if quantization == 'float16':
+        converter.target_spec.supported_types = [tf.float16]
+
+    elif quantization == 'int8':
+        if calibration is None:
+            raise ValueError("int8 quantization needs calibration windows.")
+
+        def representative_dataset():
+            for window in calibration:
+                yield [np.reshape(window, (1, *model.input_shape[1:])).astype(np.float32)]
+
+        # int8 kernels inside, float input and output so the model is a drop-in replacement
+        converter.representative_dataset = representative_dataset
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8, tf.lite.OpsSet.TFLITE_BUILTINS]
+
+    else:
+        raise ValueError(f"Unknown quantization {quantization}, expected float16 or int8.")
+
+    with open(path, 'wb') as f:
+        f.write(converter.convert())
+
+    logging.getLogger(__name__).info(f"Converted model to {path} ({quantization}, {os.path.getsize(path)/2**20:.1f} MiB).")
+    return path
+
+
+class TFLiteModel:
+
+    def __init__(self, path: str, batch_size: int = 256, num_threads: int = None) -> None:
+        """Runs a .tflite swizzle model with the same predict API as the keras model (predict, predict_on_batch, input_shape, output_shape).
+
+        Args:
+            path (str): Path to the .tflite file.
+            batch_size (int, optional): Batch size predict() splits its input into. Defaults to 256.
+            num_threads (int, optional): Threads of the interpreter. Defaults to None (number of CPUs).
+        """
+        import tensorflow as tf
+
+        self.interpreter = tf.lite.Interpreter(model_path=path, num_threads=num_threads or os.cpu_count())
+        self.input_details = self.interpreter.get_input_details()[0]
+        self.output_details = self.interpreter.get_output_details()[0]
+        self.input_shape = (None, *self.input_details['shape'][1:])
+        self.output_shape = (None, *self.output_details['shape'][1:])
+        self.batch_size = batch_size
+
+        # the interpreter is shared by the worker threads of the frontend, but can only run one batch at a time
+        self.lock = threading.Lock()
+
+        self._resize(batch_size)
+
+
+    def _resize(self, batch_size: int):
+        self.interpreter.resize_tensor_input(self.input_details['index'], [batch_size, *self.input_shape[1:]])
+        self.interpreter.allocate_tensors()
+        self.curr_batch_size = batch_size
+
+
+    def predict_on_batch(self, x: np.array) -> np.array:
+        x = np.reshape(x, (len(x), *self.input_shape[1:])).astype(np.float32, copy=False)
+
+        with self.lock:
+            # resizing reallocates tensors, keep batch sizes fixed where possible
+            if len(x) != self.curr_batch_size:
+                self._resize(len(x))
+
+            self.interpreter.set_tensor(self.input_details['index'], x)
+            self.interpreter.invoke()
+            return self.interpreter.get_tensor(self.output_details['index']).copy()
+
+
+    def predict(self, x: np.array, verbose: int = 0) -> np.array:
+        y = np.empty((len(x), *self.output_shape[1:]), dtype=np.float32)
+
+        # fixed-size batches, the last one is padded with zeros
+        for start in range(0, len(x), self.batch_size):
+            batch = np.zeros((self.batch_size, *self.input_shape[1:]), dtype=np.float32)
+            count = min(self.batch_size, len(x) - start)
+            batch[:count] = np.reshape(x[start:start + count], (count, *self.input_shape[1:]))
+            y[start:start + count] = self.predict_on_batch(batch)[:count]
+
+        return y
@@ -0,0 +1,41 @@
+                         ###################
+                        #                  #
+ #######               #  #  #####  #####  #   ###
+#       #      #      #   #     #      #   #  #   #
+ ###     #    # #    #    #    #      #    #  ####
+    #     #  #   #  #     #   #      #     #  #
+####       ##     ##      #  #####  #####  #   ###
+
+
+#############################################
+#                   IMPORTS                 #
+#############################################
+import tensorflow as tf
+
+
+# registered under 'swizzle>StringSoftmax' and 'swizzle>StringCrossentropy', so saved models load and compile as soon as this module is imported
+@tf.keras.utils.register_keras_serializable(package='swizzle')
+class StringSoftmax(tf.keras.layers.Layer):
+    """Softmax over the classes of every string, i.e. along the last axis of the (STRINGS, CLASSES) output, in a single op.
+    Only part of the inference model, training works on the logits (see StringCrossentropy)."""
+
+    def call(self, inputs):
+        return tf.nn.softmax(inputs, axis=-1)
+
+
+@tf.keras.utils.register_keras_serializable(package='swizzle')
+class StringCrossentropy(tf.keras.losses.Loss):
+
+    def __init__(self, name: str = 'string_crossentropy', **kwargs) -> None:
+        """Categorical crossentropy of every string computed from the logits, averaged over the strings. The softmax and
+        the log are fused (tf.nn.softmax_cross_entropy_with_logits), which is faster and stable for saturated strings.
+        Same scale as categorical_crossentropy on the (STRINGS, CLASSES) probabilities.
+
+        Args:
+            name (str, optional): Name of the loss. Defaults to 'string_crossentropy'.
+        """
+        super().__init__(name=name, **kwargs)
+
+    def call(self, y_true, y_pred):
+        # y_pred are the logits of the model
+        return tf.reduce_mean(tf.nn.softmax_cross_entropy_with_logits(labels=tf.cast(y_true, y_pred.dtype), logits=y_pred), axis=-1)
@@ -12,35 +12,84 @@
 #############################################
 
 import datetime
-import pathlib
-import IPython.display as display
-import matplotlib.pyplot as plt
-import pandas as pd
+import inspect
+import json
 import numpy as np
 import os
-from PIL import Image
 import logging
 
-#sklearn
-from sklearn.model_selection import train_test_split
-
 #tensorflow
 import tensorflow as tf
-import tensorflow_hub as hub
 from tensorflow import keras
-#from tensorflow.keras import layers
+from tensorflow.keras.callbacks import ReduceLROnPlateau, BackupAndRestore, ModelCheckpoint, EarlyStopping, CSVLogger
 
-#keras
-import keras
-from keras.datasets import mnist
-from keras.models import Sequential
-from keras.layers import Dense, Dropout, Flatten
-from keras.layers import Conv2D, MaxPooling2D
-from keras.callbacks import ReduceLROnPlateau
-from keras import backend as K
+#swizzle
+from preprocessing.dataset import ShardedDataset
+from model.layers import StringSoftmax, StringCrossentropy
 
 RSEED = 42
 
+
+def bfloat16_supported() -> bool:
+    """Returns whether the CPU has native bfloat16 instructions (AVX512-BF16 or AMX), on other CPUs bfloat16 is emulated and slower than float32."""
+    try:
+        with open('/proc/cpuinfo') as f:
+            flags = f.read()
+    except OSError:
+        return False
+
+    return 'avx512_bf16' in flags or 'amx_bf16' in flags
+
+
+def cpu_strategy(n_replicas: int = 1):
+    """Returns a MirroredStrategy with one replica per logical CPU device, each replica computes a slice of every batch.
+    The physical CPU is split into n_replicas logical devices, which is only possible before tensorflow has initialized
+    its devices (i.e. before the first tensor is created).
+
+    Args:
+        n_replicas (int, optional): Number of replicas. Defaults to 1 (default strategy, no distribution).
+
+    Returns:
+        tf.distribute.Strategy: strategy to build, compile and fit the model in
+    """
+    if n_replicas <= 1:
+        return tf.distribute.get_strategy()
+
+    cpu = tf.config.list_physical_devices('CPU')[0]
+    try:
+        tf.config.set_logical_device_configuration(cpu, [tf.config.LogicalDeviceConfiguration()] * n_replicas)
+    except RuntimeError:
+        # devices are initialized already, use the logical devices that exist
+        logging.getLogger(__name__).warning("Tensorflow devices are initialized already, can't add logical CPU devices.")
+
+    devices = [device.name for device in tf.config.list_logical_devices('CPU')][:n_replicas]
+    return tf.distribute.MirroredStrategy(devices=devices, cross_device_ops=tf.distribute.ReductionToOneDevice())
+
+
+def split_indices(n_samples: int, test_size: float = 0.3, validate_size: float = 0.1, seed: int = RSEED) -> tuple:
+    """Splits sample indices into seeded train, validation and test sets (validation is taken from what remains after the test set).
+
+    Args:
+        n_samples (int): Number of samples in the dataset.
+        test_size (float, optional): Fraction of samples in the test set. Defaults to 0.3.
+        validate_size (float, optional): Fraction of the remaining samples in the validation set. Defaults to 0.1.
+        seed (int, optional): Seed of the permutation. Defaults to RSEED.
+
+    Returns:
+        tuple: sorted train, validation and test indices
+    """
+    rng = np.random.default_rng(seed)
+    indices = rng.permutation(n_samples)
+
+    n_test = int(len(indices) * test_size)
+    n_validate = int((len(indices) - n_test) * validate_size)
+
+    # sorted indices keep reads within a shard sequential
+    return (np.sort(indices[n_test + n_validate:]),
+            np.sort(indices[n_test:n_test + n_validate]),
+            np.sort(indices[:n_test]))
+
+
 #############################################
 #                   MODEL                   #
 #############################################
@@ -53,41 +102,128 @@ class SwizzleModel:
                  EPOCHS=8,
                  FRAME_WIDTH = 9,
                  INPUTPATH="../data/output/",
-                 save_path="../data/model/"):   
+                 save_path="../data/model/",
+                 DTYPE="float32",
+                 SHUFFLE_BUFFER=8192,
+                 N_READERS=4,
+                 LEARNING_RATE=0.001,
+                 FILTERS=(32, 64, 64),
+                 DROPOUT=(0.25, 0.5),
+                 REMOVE_NOISE=0,
+                 MIXED_PRECISION=False,
+                 JIT_COMPILE=False,
+                 N_REPLICAS=1,
+                 PATIENCE=5,
+                 CHECKPOINT_FREQ='epoch',
+                 RESUME=False,
+                 verbose=3):   
         
+        # setup logger
+        FORMAT = "[%(levelname)8s][%(filename)s:%(lineno)4s - %(funcName)20s() ] %(message)s"
+        logging.basicConfig(format=FORMAT)
+        verbosity = {0: logging.CRITICAL, 1: logging.ERROR, 2: logging.WARNING, 3: logging.INFO, 4: logging.DEBUG}
+        self.logger = logging.getLogger(__name__)
+        self.logger.setLevel(verbosity[verbose])
+
         self.BATCH_SIZE = BATCH_SIZE
         self.EPOCHS = EPOCHS
         self.FRAME_HEIGHT = FRAME_HEIGHT
         self.FRAME_WIDTH = FRAME_WIDTH
         self.INPUTPATH = INPUTPATH
         self.save_path = save_path
+        self.DTYPE = np.dtype(DTYPE)
+        self.SHUFFLE_BUFFER = SHUFFLE_BUFFER
+        self.N_READERS = N_READERS
+        self.LEARNING_RATE = LEARNING_RATE
+        self.FILTERS = FILTERS          # filters of the three convolutions
+        self.DROPOUT = DROPOUT          # dropout after the convolutions and after the first dense layer
+        self.REMOVE_NOISE = REMOVE_NOISE
+        self.PATIENCE = PATIENCE                    # epochs without improvement of the validation accuracy before training stops
+        self.CHECKPOINT_FREQ = CHECKPOINT_FREQ      # 'epoch' or number of batches between checkpoints
         self.N_CLASSES = 21
         self.N_STRINGS = 6
 
+        # fast training: layers compute in bfloat16 (variables and the logits stay float32), steps are compiled with XLA
+        self.POLICY = 'float32'
+        if MIXED_PRECISION:
+            if bfloat16_supported():
+                self.POLICY = 'mixed_bfloat16'
+            else:
+                self.logger.warning("CPU has no bfloat16 instructions, training in float32.")
+        self.JIT_COMPILE = JIT_COMPILE
+
+        # data parallel training, BATCH_SIZE is the batch size per replica
+        self.strategy = cpu_strategy(N_REPLICAS)
+        self.N_REPLICAS = self.strategy.num_replicas_in_sync
+        self.GLOBAL_BATCH_SIZE = self.BATCH_SIZE * self.N_REPLICAS
+
         self.load_files()
+        self.data_split()
         
-        self.save_folder = self.save_path + datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S") + "/"
+        # continue an interrupted run (i.e. one with a checkpoint left) with the same config in its folder
+        self.save_folder = self.interrupted_run() if RESUME else None
+        if self.save_folder is not None:
+            self.logger.warning(f"Resuming interrupted run in {self.save_folder}, its checkpoint is restored when training starts.")
+        else:
+            self.save_folder = self.save_path + datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S") + "/"
+
         if not os.path.exists(self.save_folder):
             os.makedirs(self.save_folder)
+
+        with open(self.save_folder + 'config.json', 'w') as f:
+            json.dump(self.run_config(), f, indent=4)
         
         # Check for Tensorflow version
         print(tf.__version__)
         tf.compat.v1.logging.set_verbosity(tf.compat.v1.logging.INFO)
 
 
-    def load_files(self, file_name: str):
+    def run_config(self) -> dict:
+        """Returns the settings of the run (the upper case attributes without paths), as stored in config.json of the run folder."""
+        config = {k: v for k, v in vars(self).items() if k.isupper() and not k.endswith('PATH')}
+
+        # same types as after loading config.json (lists instead of tuples, dtypes as names)
+        return json.loads(json.dumps(config, default=str))
+
+
+    def interrupted_run(self) -> str:
+        """Returns the folder of the latest run in save_path whose training was interrupted and whose config.json matches
+        the config of this model exactly, None if there is none. The checkpoint of a run is deleted when its training finishes.
+        """
+        if not os.path.isdir(self.save_path):
+            return None
+
+        # folders are named by their start time, so the latest one sorts last
+        checkpoints = {f: os.path.join(self.save_path, f, 'checkpoint') for f in os.listdir(self.save_path)}
+        runs = sorted(f for f, checkpoint in checkpoints.items() if os.path.isdir(checkpoint) and os.listdir(checkpoint))
 
-        IMAGES = np.load(self.INPUTPATH + 'training_data.npz')
-        annots = np.load(self.INPUTPATH + 'training_labels.npz')
+        for run in reversed(runs):
+            path = os.path.join(self.save_path, run, 'config.json')
+            if not os.path.exists(path):
+                self.logger.info(f"Not resuming interrupted run {run}, it has no config.json.")
+                continue
 
-        self.logger.info(f"Loading output images and annotations.")
-        return IMAGES, annots
+            with open(path) as f:
+                config = json.load(f)
+            if config == self.run_config():
+                return os.path.join(self.save_path, run) + "/"
 
+            changed = sorted(k for k in set(config) | set(self.run_config()) if config.get(k) != self.run_config().get(k))
+            self.logger.info(f"Not resuming interrupted run {run}, its config differs in {', '.join(changed)}.")
 
-    def data_split(self, images, annots, file_name: str):
+        return None
 
-        self.IMAGES = images
-        self.annots = annots
+
+    def load_files(self):
+
+        # sharded dataset written by the PreProcessor/Funnel, samples stay on disk until they are read by the input pipeline
+        self.dataset = ShardedDataset(self.INPUTPATH)
+
+        self.logger.info(f"Opened dataset with {len(self.dataset)} samples in {self.dataset.n_shards} shards.")
+        return self.dataset
+
+
+    def data_split(self):
 
         """
         First we have to split our dataset into train and test set. 
@@ -96,32 +232,88 @@ class SwizzleModel:
         We take this time 10% of the train set for 
         the validation set and take the rest for training.
 
+        Only the sample indices are split, no data is copied.
         '"""
-        self.train_images, self.test_images, self.train_annots, self.test_annots = train_test_split(
-            images['arr_0'], annots['arr_0'], test_size= 0.3, random_state= RSEED )
-        self.train_images, self.validate_images,self.train_annots,self.validate_annots = train_test_split(
-            self.train_images,self.train_annots, test_size = 0.1,random_state = RSEED)
+        self.train_idx, self.validate_idx, self.test_idx = split_indices(len(self.dataset))
 
-        self.logger.info(f"Split the data into train, validation and test sets.")
+        # only the training set, so that validation and test results stay comparable
+        if self.REMOVE_NOISE > 0:
+            self.train_idx = self.remove_noise(self.train_idx, self.REMOVE_NOISE)
 
+        self.logger.info(f"Split the data into train ({len(self.train_idx)}), validation ({len(self.validate_idx)}) and test ({len(self.test_idx)}) sets.")
 
-    def catcross_by_string(self,target, output):
-        '''The normal categorical_crossentropy was not working with our model, so we had to use a 
-        categorical crossentropy which is working string by string.
-        It takes:
-        It returns: Our loss function'''
-        loss = 0
-        for i in range(self.N_STRINGS):
-            loss += K.categorical_crossentropy(target[:,i,:], output[:,i,:])
-        return loss
 
-    
-    def softmax_by_string(self,t):
-        sh = K.shape(t)
-        string_sm = []
-        for i in range(self.N_STRINGS):
-            string_sm.append(K.expand_dims(K.softmax(t[:,i,:]), axis=1))
-        return K.concatenate(string_sm, axis=1)
+    def remove_noise(self, indices: np.array, fraction: float) -> np.array:
+        """Removes a fraction of the windows in which no string is played, like PreProcessor.remove_noise() but on a dataset
+        generated with less (or no) noise removed.
+
+        Args:
+            indices (np.array): Sample indices.
+            fraction (float): Fraction of the empty windows to be removed.
+
+        Returns:
+            np.array: sorted indices of the kept windows
+        """
+        # a window is empty if every string is "not played" (1 at position 0)
+        empty = indices[np.all(self.dataset.take('windowlabels', indices)[..., 0] == 1, axis=-1)]
+
+        rng = np.random.default_rng(RSEED)
+        removed = rng.choice(empty, size=int(len(empty) * fraction), replace=False)
+
+        self.logger.info(f"Removed {len(removed)} of {len(empty)} empty windows.")
+        return np.setdiff1d(indices, removed)
+
+
+    def make_dataset(self, indices, shuffle=False, labels=True):
+
+        '''
+        Builds a tf.data input pipeline over the samples at the given indices of the sharded dataset.
+        Shards are read lazily from their memory maps, several at once (parallel interleave), in blocks of
+        GLOBAL_BATCH_SIZE samples. For training the shard order and the samples (within a buffer of SHUFFLE_BUFFER)
+        are shuffled every epoch. Batches are prefetched, so reading overlaps with training and memory
+        does not grow with the dataset. With several replicas every global batch is split between them.
+        '''
+        shard_size = self.dataset.shard_size
+        shards = indices // shard_size
+        rows = {shard: indices[shards == shard] - shard * shard_size for shard in np.unique(shards)}
+        arrays = self.dataset.manifest['arrays']
+
+        def read_shard(shard):
+            windows = self.dataset.shard('windows', shard)
+            annots = self.dataset.shard('windowlabels', shard)
+            shard_rows = rows[int(shard)]
+            for start in range(0, len(shard_rows), self.GLOBAL_BATCH_SIZE):
+                block = shard_rows[start:start + self.GLOBAL_BATCH_SIZE]
+                yield windows[block], annots[block]
+
+        signature = (tf.TensorSpec(shape=(None, *arrays['windows']['shape']), dtype=arrays['windows']['dtype']),
+                     tf.TensorSpec(shape=(None, *arrays['windowlabels']['shape']), dtype=arrays['windowlabels']['dtype']))
+
+        ds = tf.data.Dataset.from_tensor_slices(np.array(list(rows), dtype=np.int64))
+        if shuffle:
+            ds = ds.shuffle(len(rows), seed=RSEED, reshuffle_each_iteration=True)
+
+        ds = ds.interleave(lambda shard: tf.data.Dataset.from_generator(read_shard, args=(shard,), output_signature=signature),
+                           cycle_length=self.N_READERS, num_parallel_calls=tf.data.AUTOTUNE, deterministic=not shuffle)
+        ds = ds.unbatch()
+
+        if shuffle:
+            ds = ds.shuffle(self.SHUFFLE_BUFFER, seed=RSEED, reshuffle_each_iteration=True)
+
+        # add channel axis and cast to the model dtype per batch
+        # the last training batch of an epoch is dropped with several replicas, unevenly split batches fail in the oneDNN convolution gradients
+        ds = ds.batch(self.GLOBAL_BATCH_SIZE, drop_remainder=shuffle and self.N_REPLICAS > 1)
+        ds = ds.map(lambda x, y: (tf.expand_dims(tf.cast(x, self.DTYPE.name), -1), tf.cast(y, self.DTYPE.name)), num_parallel_calls=tf.data.AUTOTUNE)
+
+        if not labels:
+            ds = ds.map(lambda x, y: x)
+
+        # samples come from a generator, so batches are split between the replicas, not files
+        options = tf.data.Options()
+        options.experimental_distribute.auto_shard_policy = tf.data.experimental.AutoShardPolicy.DATA
+        ds = ds.with_options(options)
+
+        return ds.prefetch(tf.data.AUTOTUNE)
 
 
     def cnn_swizzle_model(self): 
@@ -134,28 +326,41 @@ class SwizzleModel:
 
         An array with the size 6x21. This is representing the 6 different strings of a guitar and 19 different 
         frets of the guitar. The other 2 of the 21 entries represent, if a string is played or not played.
+        The model is trained on the logits, inference_model() adds the softmax of every string.
 
         The different layers we used you can easily extract from below.
         '''      
-        swizzle_model = tf.keras.Sequential()
-        swizzle_model.add(tf.keras.layers.InputLayer(input_shape=[self.FRAME_HEIGHT, self.FRAME_WIDTH, 1]))
-        swizzle_model.add(tf.keras.layers.Conv2D(filters=32, kernel_size=(3, 3),activation='relu'))
-        swizzle_model.add(tf.keras.layers.Conv2D(filters=64, kernel_size=(3, 3), activation='relu'))
-        swizzle_model.add(tf.keras.layers.Conv2D(filters=64, kernel_size=(3, 3), activation='relu'))
-        swizzle_model.add(tf.keras.layers.MaxPooling2D(pool_size=(2, 2)))
-        swizzle_model.add(tf.keras.layers.Dropout(0.25))   
-        swizzle_model.add(tf.keras.layers.Flatten())
-        swizzle_model.add(tf.keras.layers.Dense(128, activation='relu'))
-        swizzle_model.add(tf.keras.layers.Dropout(0.5))
-        swizzle_model.add(tf.keras.layers.Dense(126, activation='relu'))
-        swizzle_model.add(tf.keras.layers.Dense(self.N_CLASSES * self.N_STRINGS)) # no activation
-        swizzle_model.add(tf.keras.layers.Reshape((self.N_STRINGS, self.N_CLASSES)))
-        swizzle_model.add(tf.keras.layers.Activation(self.softmax_by_string))
+        policy = tf.keras.mixed_precision.Policy(self.POLICY)
+
+        # variables are mirrored on all replicas
+        with self.strategy.scope():
+            swizzle_model = tf.keras.Sequential()
+            swizzle_model.add(tf.keras.layers.InputLayer(input_shape=[self.FRAME_HEIGHT, self.FRAME_WIDTH, 1], dtype=self.DTYPE.name))
+            swizzle_model.add(tf.keras.layers.Conv2D(filters=self.FILTERS[0], kernel_size=(3, 3),activation='relu', dtype=policy))
+            swizzle_model.add(tf.keras.layers.Conv2D(filters=self.FILTERS[1], kernel_size=(3, 3), activation='relu', dtype=policy))
+            swizzle_model.add(tf.keras.layers.Conv2D(filters=self.FILTERS[2], kernel_size=(3, 3), activation='relu', dtype=policy))
+            swizzle_model.add(tf.keras.layers.MaxPooling2D(pool_size=(2, 2), dtype=policy))
+            swizzle_model.add(tf.keras.layers.Dropout(self.DROPOUT[0], dtype=policy))   
+            swizzle_model.add(tf.keras.layers.Flatten(dtype=policy))
+            swizzle_model.add(tf.keras.layers.Dense(128, activation='relu', dtype=policy))
+            swizzle_model.add(tf.keras.layers.Dropout(self.DROPOUT[1], dtype=policy))
+            swizzle_model.add(tf.keras.layers.Dense(126, activation='relu', dtype=policy))
+            swizzle_model.add(tf.keras.layers.Dense(self.N_CLASSES * self.N_STRINGS, dtype=policy)) # no activation
+            # the logits always leave the model in float32, bfloat16 is too coarse for the crossentropy
+            swizzle_model.add(tf.keras.layers.Reshape((self.N_STRINGS, self.N_CLASSES), dtype='float32'))
 
         self.swizzle_model = swizzle_model
         return swizzle_model
 
 
+    def inference_model(self):
+        """Returns the trained model with the softmax of every string added, sharing the weights of swizzle_model.
+        This is the model that is saved and predicts probabilities of shape (STRINGS, CLASSES)."""
+        with self.strategy.scope():
+            outputs = StringSoftmax(dtype='float32')(self.swizzle_model.output)
+            return tf.keras.Model(self.swizzle_model.input, outputs)
+
+
     def compile_model(self):
 
         '''
@@ -164,15 +369,18 @@ class SwizzleModel:
         have the same importance.
 
         Optimizer: As an optimizer we take the adam optimizer, which is fast enough to handle our data 
-        in a short time
+        in a short time. With JIT_COMPILE the train, test and predict steps are compiled with XLA, which fuses
+        the small ops of the model (the first epoch is slower because of the compilation).
 
         Loss function: For the loss function we used categorical crossentropy because we have multiple classes or labels
         with soft probabilities like [0.5, 0.3, 0.2] and also have a shape like a one-hot-encoded array.
+        The crossentropy is computed from the logits string by string and averaged over the strings (StringCrossentropy).
         '''
         metrics =['accuracy']
-        optimizer = tf.keras.optimizers.Adam(learning_rate=0.001)
-        loss='categorical_crossentropy'
-        self.swizzle_model.compile(loss=loss, optimizer=optimizer, metrics=['accuracy'])
+        with self.strategy.scope():
+            optimizer = tf.keras.optimizers.Adam(learning_rate=self.LEARNING_RATE)
+            loss = StringCrossentropy()
+            self.swizzle_model.compile(loss=loss, optimizer=optimizer, metrics=['accuracy'], jit_compile=self.JIT_COMPILE)
    
     
     def train_model(self):
@@ -184,59 +392,95 @@ class SwizzleModel:
         '''
         learning_rate_reduction = ReduceLROnPlateau(monitor='val_accuracy', patience=3, verbose=1, factor=0.5, min_lr=0.0001)
 
-        #for the training we fit our model and use the batch size and epochs from our constants
-        history = self.swizzle_model.fit(self.train_images,
-                                    self.train_annots,
-                                    batch_size=self.BATCH_SIZE,
+        '''
+        Model, optimizer state and epoch are checkpointed into the save folder every CHECKPOINT_FREQ, so an interrupted
+        run continues where it stopped when the model is created again with RESUME and the same config and trained.
+        The checkpoint is deleted when the training finishes. Training stops early if the validation accuracy did not
+        improve for PATIENCE epochs, the weights of the best epoch (over all resumes, see history.csv) are restored at the end.
+        The counters of EarlyStopping and ReduceLROnPlateau are not checkpointed, they start again at every resume
+        (the learning rate itself is part of the optimizer state and is restored).
+        '''
+        # BackupAndRestore only takes a save_freq since TF 2.11, older versions back up at the end of every epoch
+        if 'save_freq' in inspect.signature(BackupAndRestore.__init__).parameters:
+            checkpoint = BackupAndRestore(self.save_folder + 'checkpoint', save_freq=self.CHECKPOINT_FREQ)
+        else:
+            if self.CHECKPOINT_FREQ != 'epoch':
+                self.logger.warning(f"TensorFlow {tf.__version__} can only checkpoint every epoch, not every {self.CHECKPOINT_FREQ} batches.")
+            checkpoint = BackupAndRestore(self.save_folder + 'checkpoint')
+        history_log = CSVLogger(self.save_folder + 'history.csv', append=True)
+
+        # only save weights that beat the best epoch of earlier resumes (set after construction, initial_value_threshold needs TF 2.9)
+        best_weights = ModelCheckpoint(self.save_folder + 'best/weights', monitor='val_accuracy', save_best_only=True, save_weights_only=True)
+        if self.best_val_accuracy() is not None:
+            best_weights.best = self.best_val_accuracy()
+        early_stopping = EarlyStopping(monitor='val_accuracy', patience=self.PATIENCE, verbose=1)
+
+        #for the training we fit our model on the streaming input pipelines, batch size is set in make_dataset
+        history = self.swizzle_model.fit(self.make_dataset(self.train_idx, shuffle=True),
                                     epochs=self.EPOCHS,
                                     verbose=1,
-                                    use_multiprocessing=True,
-                                    validation_data=(self.validate_images,self.validate_annots),
-                                    callbacks=[learning_rate_reduction],
+                                    validation_data=self.make_dataset(self.validate_idx),
+                                    callbacks=[learning_rate_reduction, checkpoint, history_log, best_weights, early_stopping],
         )
 
-        score = self.swizzle_model.evaluate(self.test_images,self.test_annots,verbose=0)
+        if os.path.exists(self.save_folder + 'best/weights.index'):
+            self.swizzle_model.load_weights(self.save_folder + 'best/weights')
+            self.logger.info(f"Restored weights of the best epoch (val_accuracy {self.best_val_accuracy():.4f}).")
+
+        score = self.swizzle_model.evaluate(self.make_dataset(self.test_idx),verbose=0)
         print('Test Loss : {:.4f}'.format(score[0]))
         print('Test Accuracy : {:.4f}'.format(score[1]))
 
 
+    def best_val_accuracy(self) -> float:
+        """Returns the best validation accuracy of the epochs trained in the save folder so far, None before the first epoch."""
+        if not os.path.exists(self.save_folder + 'history.csv'):
+            return None
+
+        history = np.genfromtxt(self.save_folder + 'history.csv', delimiter=',', names=True, ndmin=1)
+        if 'val_accuracy' not in history.dtype.names or len(history) == 0:
+            return None
+
+        return float(np.max(history['val_accuracy']))
+
+
     def predict_model(self):
         swizzle_model = keras.models.load_model("../app/model/swizzle_model")
-        self.model_output = self.swizzle_model.predict(self.test_images)
+        self.model_output = self.inference_model().predict(self.make_dataset(self.test_idx, labels=False))
         self.logger.info(f"swizzle is doing the magic :)")
 
 
-    def save_model(self):
-        # create directory
-        if not os.path.exists(self.save_path):
-            os.makedirs(self.save_path)
-
-        # get path
+    def save_model(self, path: str = None):
+        # get path, defaults to the folder of this run
         if not path:
-            path = self.save_path
+            path = self.save_folder
 
         # fix path string
         if not path.endswith('/'): 
             path += '/'
 
+        # create directory
+        if not os.path.exists(path):
+            os.makedirs(path)
+
         # save files if data is present
-        self.swizzle_model.save(self.save_path + 'swizzle_model')
+        self.inference_model().save(path + 'swizzle_model')
         self.logger.info(f"swizzle model is being saved :)")
 
 
-    def save_output(self):     
-        # create directory
-        if not os.path.exists(self.save_path):
-            os.makedirs(self.save_path)
-
-        # get path
+    def save_output(self, path: str = None):
+        # get path, defaults to the folder of this run
         if not path:
-            path = self.save_path
+            path = self.save_folder
 
         # fix path string
         if not path.endswith('/'): 
             path += '/'
 
+        # create directory
+        if not os.path.exists(path):
+            os.makedirs(path)
+
         # save files if data is present
-        np.save(self.save_path + "model_output.npy", self.model_output, allow_pickle=True, fix_imports=True)
+        np.save(path + "model_output.npy", self.model_output, allow_pickle=True, fix_imports=True)
         self.logger.info(f"swizzle model output is being saved :)")
\ No newline at end of file
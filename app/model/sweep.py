@@ -0,0 +1,251 @@
+                         ###################
+                        #                  #
+ #######               #  #  #####  #####  #   ###
+#       #      #      #   #     #      #   #  #   #
+ ###     #    # #    #    #    #      #    #  ####
+    #     #  #   #  #     #   #      #     #  #
+####       ##     ##      #  #####  #####  #   ###
+
+
+#############################################
+#                   IMPORTS                 #
+#############################################
+
+import argparse
+import csv
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+
+
+#############################################
+#                   CONSTANTS               #
+#############################################
+DATASETPATH = '../data/output/'
+OUTPUTPATH = '../data/sweep/'
+RSEED = 42
+
+# values per SwizzleModel argument, trials are drawn from the grid of all combinations
+SPACE = {'BATCH_SIZE': [64, 128, 256],
+         'LEARNING_RATE': [0.0003, 0.001, 0.003],
+         'DROPOUT': [[0.25, 0.5], [0.1, 0.3]],
+         'FILTERS': [[16, 32, 32], [32, 64, 64], [32, 64, 128]],
+         'REMOVE_NOISE': [0, 0.5, 0.9]}
+
+
+def sample_trials(space: dict = SPACE, n_trials: int = None, seed: int = RSEED) -> list:
+    """Draws trials from the grid of all combinations of the search space, without repetition.
+
+    Args:
+        space (dict, optional): Values per SwizzleModel argument. Defaults to SPACE.
+        n_trials (int, optional): Number of trials. Defaults to None (whole grid).
+        seed (int, optional): Seed for drawing the trials. Defaults to RSEED.
+
+    Returns:
+        list: parameters (dict) of every trial
+    """
+    grid = [dict(zip(space, values)) for values in itertools.product(*space.values())]
+
+    if n_trials is None or n_trials >= len(grid):
+        return grid
+
+    rng = np.random.default_rng(seed)
+    return [grid[i] for i in sorted(rng.choice(len(grid), n_trials, replace=False))]
+
+
+def _pin(cores, threads: int):
+    """Initializes a worker process: pins it to its own set of cores and limits the threads of tensorflow to them.
+    Runs before tensorflow is initialized, the thread pools can't be changed afterwards.
+
+    Args:
+        cores (Queue): Core sets that are not taken by another worker yet.
+        threads (int): Number of threads of the worker.
+    """
+    # the queue holds one core set per worker, a worker started beyond that (the pool doesn't replace crashed workers,
+    # it breaks) would find it drained and run unpinned with the same thread budget instead of waiting forever
+    if hasattr(os, 'sched_setaffinity'):
+        try:
+            os.sched_setaffinity(0, cores.get_nowait())
+        except queue.Empty:
+            logging.getLogger(__name__).warning(f"No free core set left, worker {os.getpid()} runs unpinned.")
+
+    import tensorflow as tf
+    tf.config.threading.set_intra_op_parallelism_threads(threads)
+    tf.config.threading.set_inter_op_parallelism_threads(1 if threads < 4 else 2)
+
+
+def run_trial(trial: int, params: dict, history, dataset_path: str = DATASETPATH, outputpath: str = OUTPUTPATH, epochs: int = 8, grace: int = 2) -> dict:
+    """Trains a model with the parameters of one trial. Executed in a worker process.
+    The dataset is opened as memory maps, so all workers share one copy of it in the page cache.
+
+    Args:
+        trial (int): Id of the trial.
+        params (dict): Arguments of the SwizzleModel (see SPACE).
+        history: Shared dict of the validation accuracies per epoch of all trials, for early stopping.
+        dataset_path (str, optional): Path to the dataset. Defaults to DATASETPATH.
+        outputpath (str, optional): Path of the sweep, the model of the trial is saved in trial_<id>/. Defaults to OUTPUTPATH.
+        epochs (int, optional): Maximum number of epochs. Defaults to 8.
+        grace (int, optional): Epochs before a trial can be stopped early. Defaults to 2.
+
+    Returns:
+        dict: id, parameters, epochs trained, whether the trial was stopped early, best validation accuracy and loss,
+            training samples/sec (of fit only), wall time of the whole trial
+    """
+    import tensorflow as tf
+    from model.model import SwizzleModel
+
+    class MedianStopping(tf.keras.callbacks.Callback):
+        # stops the trial if its validation accuracy is below the median of the other trials after the same epoch
+        def on_epoch_end(self, epoch, logs=None):
+            accuracies = history.get(trial, []) + [logs['val_accuracy']]
+            history[trial] = accuracies
+
+            others = [h[epoch] for t, h in history.items() if t != trial and len(h) > epoch]
+            if epoch + 1 >= grace and others and accuracies[-1] < np.median(others):
+                self.model.stop_training = True
+
+    start = time.perf_counter()
+    tf.keras.utils.set_random_seed(RSEED)
+
+    m = SwizzleModel(INPUTPATH=dataset_path, save_path=os.path.join(outputpath, f"trial_{trial}/"), EPOCHS=epochs, verbose=2, **params)
+    m.cnn_swizzle_model()
+    m.compile_model()
+
+    fit_start = time.perf_counter()
+    fit = m.swizzle_model.fit(m.make_dataset(m.train_idx, shuffle=True), epochs=epochs, verbose=0,
+                              validation_data=m.make_dataset(m.validate_idx), callbacks=[MedianStopping()])
+    fit_duration = time.perf_counter() - fit_start
+    m.inference_model().save(os.path.join(m.save_folder, 'swizzle_model'))
+
+    best = int(np.argmax(fit.history['val_accuracy']))
+    duration = time.perf_counter() - start
+
+    return {'trial': trial,
+            **{k: json.dumps(v) if isinstance(v, list) else v for k, v in params.items()},
+            'epochs': len(fit.history['val_accuracy']),
+            'stopped': len(fit.history['val_accuracy']) < epochs,
+            'val_accuracy': fit.history['val_accuracy'][best],
+            'val_loss': fit.history['val_loss'][best],
+            'samples_per_sec': len(m.train_idx) * len(fit.history['val_accuracy']) / fit_duration,
+            'seconds': duration,
+            'model': m.save_folder}
+
+
+def sweep(trials: list, dataset_path: str = DATASETPATH, outputpath: str = OUTPUTPATH, parallel: int = None, epochs: int = 8, grace: int = 2, verbose: int = 3) -> list:
+    """Runs the trials in parallel worker processes, every worker is pinned to its own cores.
+    Trials whose validation accuracy falls below the median of the other trials are stopped early.
+    The results are written to results.csv in the output path as soon as a trial is finished. If a worker crashes
+    (e.g. killed when out of memory), the pool breaks and the remaining trials are not run, results.csv keeps the finished ones.
+
+    Args:
+        trials (list): Parameters of every trial, see sample_trials().
+        dataset_path (str, optional): Path to the dataset. Defaults to DATASETPATH.
+        outputpath (str, optional): Path of the results and the models of the trials. Defaults to OUTPUTPATH.
+        parallel (int, optional): Number of trials running at the same time. Defaults to None (a quarter of the cores, at least 1).
+        epochs (int, optional): Maximum number of epochs per trial. Defaults to 8.
+        grace (int, optional): Epochs before a trial can be stopped early. Defaults to 2.
+        verbose (int, optional): Verbosity level of the logger. Defaults to 3.
+
+    Returns:
+        list: results of the finished trials (see run_trial()), best validation accuracy first
+    """
+    # setup logger
+    FORMAT = "[%(levelname)8s][%(filename)s:%(lineno)4s - %(funcName)20s() ] %(message)s"
+    logging.basicConfig(format=FORMAT)
+    verbosity = {0: logging.CRITICAL, 1: logging.ERROR, 2: logging.WARNING, 3: logging.INFO, 4: logging.DEBUG}
+    logger = logging.getLogger(__name__)
+    logger.setLevel(verbosity[verbose])
+
+    os.makedirs(outputpath, exist_ok=True)
+
+    # split the cores into one set per worker
+    cores = sorted(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else list(range(os.cpu_count()))
+    parallel = min(parallel or max(1, len(cores) // 4), len(cores), len(trials))
+    threads = len(cores) // parallel
+
+    context = multiprocessing.get_context('spawn')
+    manager = context.Manager()
+    history = manager.dict()
+    core_sets = manager.Queue()
+    for i in range(parallel):
+        core_sets.put(set(cores[i * threads:(i + 1) * threads]))
+
+    logger.info(f"Running {len(trials)} trials, {parallel} at a time with {threads} threads each.")
+
+    results = []
+    with ProcessPoolExecutor(max_workers=parallel, mp_context=context, initializer=_pin, initargs=(core_sets, threads)) as executor:
+        futures = {executor.submit(run_trial, trial, params, history, dataset_path, outputpath, epochs, grace): trial for trial, params in enumerate(trials)}
+
+        for done, future in enumerate(as_completed(futures), 1):
+            try:
+                result = future.result()
+            except BrokenProcessPool:
+                logger.critical(f"A worker crashed, the remaining {len(trials) - done + 1} trials are not run. "
+                                f"Results of the {len(results)} finished trials are in {os.path.join(outputpath, 'results.csv')}.")
+                break
+            except Exception as e:
+                logger.error(f"[{done}/{len(trials)}] trial {futures[future]} failed: {e}")
+                continue
+
+            results.append(result)
+            results.sort(key=lambda r: r['val_accuracy'], reverse=True)
+            write_results(results, os.path.join(outputpath, 'results.csv'))
+
+            logger.info(f"[{done}/{len(trials)}] trial {result['trial']}: val_accuracy {result['val_accuracy']:.4f} after {result['epochs']} epochs"
+                        f"{' (stopped early)' if result['stopped'] else ''} in {result['seconds']:.0f}s.")
+
+    manager.shutdown()
+    return results
+
+
+def write_results(results: list, path: str):
+    """Writes the results of the trials as a table (csv).
+
+    Args:
+        results (list): Results of the trials, see run_trial().
+        path (str): Path of the csv file.
+    """
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=list(results[0]))
+        writer.writeheader()
+        writer.writerows(results)
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Sweep hyperparameters of the swizzle model with parallel trials on one machine.")
+    parser.add_argument("--dataset", default=DATASETPATH, help=f"dataset to train on, generate it with remove_noise=0 to sweep REMOVE_NOISE (default: {DATASETPATH})")
+    parser.add_argument("--output", default=OUTPUTPATH, help=f"folder of the results table and the models of the trials (default: {OUTPUTPATH})")
+    parser.add_argument("--space", help="json file with the values per SwizzleModel argument (default: SPACE in this module)")
+    parser.add_argument("--trials", type=int, default=None, help="number of trials drawn from the grid (default: whole grid)")
+    parser.add_argument("--parallel", type=int, default=None, help="trials running at the same time (default: a quarter of the cores)")
+    parser.add_argument("--epochs", type=int, default=8, help="maximum epochs per trial (default: 8)")
+    parser.add_argument("--grace", type=int, default=2, help="epochs before a trial can be stopped early (default: 2)")
+    parser.add_argument("--verbose", type=int, default=3, help="verbosity of the logger (0-4, default: 3)")
+    args = parser.parse_args()
+
+    space = SPACE
+    if args.space:
+        with open(args.space) as f:
+            space = json.load(f)
+
+    results = sweep(sample_trials(space, args.trials), args.dataset, args.output, args.parallel, args.epochs, args.grace, args.verbose)
+
+    print(f"{'trial':>5s} {'val_acc':>8s} {'epochs':>6s} {'samples/s':>10s}   parameters")
+    for result in results:
+        params = ", ".join(f"{k}={result[k]}" for k in space)
+        print(f"{result['trial']:5d} {result['val_accuracy']:8.4f} {result['epochs']:6d}{'*' if result['stopped'] else ' '} {result['samples_per_sec']:9.0f}   {params}")
+    print("* stopped early")
+
+
+
+if __name__ == "__main__":
+    main()
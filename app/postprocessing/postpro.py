@@ -14,6 +14,8 @@ import numpy as np
 import logging
 import os
 
+from profiling import profiled
+
 
 #############################################
 #                   CONSTANTS               #
@@ -28,7 +30,18 @@ STANDARDE = [40, 45, 50, 55, 59, 64]
 
 class PostProcessor:
 
-    def __init__(self, verbose: int = 3):
+    def __init__(self, remove_duplicates: bool = True, verbose: int = 3):
+        """Turns swizzle predictions into tabs, either all at once with postprocess_data() or chunk by chunk with feed() and flush().
+
+        Args:
+            remove_duplicates (bool, optional): Skip frames that repeat the frets of the frame before in feed(). Defaults to True.
+            verbose (int, optional): Verbosity level of logger. Defaults to 3.
+        """
+        # streaming state: classes of the last frame fed and next position
+        self.remove_duplicates = remove_duplicates
+        self.last = None
+        self.pos = 0
+
         # setup logger
         FORMAT = "[%(levelname)8s][%(filename)s:%(lineno)4s - %(funcName)20s() ] %(message)s"
         logging.basicConfig(format=FORMAT)
@@ -37,11 +50,17 @@ class PostProcessor:
         self.logger.setLevel(verbosity[verbose])
 
     
+    @profiled('postprocess')
     def postprocess_data(self, y: np.array, remove_duplicates: bool = True, test: np.array = np.zeros((0))) -> np.array:
         """Processes predictions from swizzle. Returns list with position, string, fret.
 
+        Every frame in which at least one string is played becomes a position in the tabs. With remove_duplicates,
+        a frame only becomes a new position if the fret of at least one string changed since the frame before
+        (run-length encoding of the frets per string). The whole chord of that frame is written to the tabs.
+
         Args:
             y (np.array): Prediction array from swizzle
+            remove_duplicates (bool, optional): Skip frames that repeat the frets of the frame before. Defaults to True.
             test (np.array, optional): Testoutput for method testing. Defaults to np.zeros((0)).
 
         Returns:
@@ -49,110 +68,96 @@ class PostProcessor:
         """
 
         self.logger.info("Starting postprocessing.")
-        self.logger.info("Checking shape.")
 
         # checking the shape of input
-        if y.shape[1] == 6 and y.shape[2] == 21:
-
-            self.logger.info(f"Received {y.shape[0]} frames.")
-
-            r = []
-            pos = 0
-            next_pos = False
-
-            # map probability outputs of the cnn to 1 and 0 using argmax
-            y_corr = np.zeros_like(y)
-
-            for fidx, frame in enumerate(y):
-                for sidx, string in enumerate(frame):
-                    y_corr[fidx][sidx][np.argmax(string)] = 1
-            
-            self.logger.info("Mapped probabilities to [0, 1] using argmax.")
-
-            if remove_duplicates:
-                self.logger.info(f"Remove duplicates is {remove_duplicates}.")
-                # input: n x (6, 21)
-                # convert frame to midi note (string_base_note + fret)
-                # store midi note and frame index in midi_curr, idx_curr
-                # continue until new midi note: midi_new, idx_new
-                # get index of last seen midi_curr
-                # remove positions idx_curr+1 to idx_new
-
-                midi_curr = 0
-
-                # loop over every frame
-                for fidx, frame in enumerate(y_corr):
-                    self.logger.info(f"Processing frame {fidx+1}/{y.shape[0]}.")
-                # loop over every string
-                    for sidx, string in enumerate(frame):
-                        # extract fret indices
-                        fret_idx = np.where(string == 1)
-                        self.logger.debug(f"Fret indices for string {sidx} at position {pos}: {fret_idx}")
-                        # reshape data to output shape
-                        if np.sum(fret_idx) > 0:
-                            # extract empty string midi value
-                            esmv = STANDARDE[sidx]
-                            # check if note is new
-                            if esmv + fret_idx[0] - 1 != midi_curr:
-                                # allow for position to count up
-                                next_pos = True
-                                # append frame if new note found
-                                for i in fret_idx:
-                                    # safety loop if multiple elements per string
-                                    # this shouldn't happen, but who knows
-                                    for j in i:
-                                        r.append([pos, sidx, np.squeeze(j)-1])
-                                # set midi_curr new note
-                                midi_curr = esmv + fret_idx[0] - 1
-                            # just do nothing if note is already known
-                            else:
-                                next_pos = False
-                    
-                    # next position
-                    if next_pos: 
-                        pos += 1
-                        next_pos = False
-                
-            else:
-                self.logger.info(f"Remove duplicates is {remove_duplicates}.")
-                # loop over every frame
-                for fidx, frame in enumerate(y_corr):
-                    self.logger.info(f"Processing frame {fidx+1}/{y.shape[0]}.")
-                    # loop over every string
-                    for sidx, string in enumerate(frame):
-                        # extract fret indices
-                        fret_idx = np.where(string == 1)
-                        self.logger.debug(f"Fret indices for string {sidx} at position {pos}: {fret_idx}")
-                        # reshape data to output shape
-                        if np.sum(fret_idx) > 0:
-                            next_pos = True
-                            for i in fret_idx:
-                                # safety loop if multiple elements per string
-                                # this shouldn't happen, but who knows
-                                for j in i:
-                                    r.append([pos, sidx, np.squeeze(j)-1])
-                        else:
-                            next_pos = False
-                    
-                    # next position
-                    if next_pos: 
-                        pos += 1
-                        next_pos = False
-
-            self.logger.info("Done.")
-
-            if test.size > 0:
-                self.logger.debug("Testing output against test data:")
-                if np.array(r).shape == test.shape:
-                    self.logger.debug("Shape: passed.")
-                    self.logger.debug(f"Content: {'passed' if np.all(r == test) else 'failed'}.")
-                else:
-                    self.logger.debug("Shape: failed.")
-
-            return np.array(r)
-
-        else:
+        if y.ndim != 3 or y.shape[1] != 6 or y.shape[2] != 21:
             self.logger.error("Data is in the wrong shape (expects (n, 6, 21).")
+            return
+
+        self.logger.info(f"Received {y.shape[0]} frames.")
+        self.logger.info(f"Remove duplicates is {remove_duplicates}.")
+
+        r, _, n_positions = self._tabs(y, remove_duplicates)
+
+        self.logger.info(f"Done, {len(r)} notes at {n_positions} positions.")
+
+        if test.size > 0:
+            self.logger.debug("Testing output against test data:")
+            if r.shape == test.shape:
+                self.logger.debug("Shape: passed.")
+                self.logger.debug(f"Content: {'passed' if np.all(r == test) else 'failed'}.")
+            else:
+                self.logger.debug("Shape: failed.")
+
+        return r
+
+
+    @profiled('postprocess')
+    def feed(self, y: np.array) -> np.array:
+        """Processes the next chunk of predictions. Duplicate removal and positions continue from the chunks fed before,
+        so the tabs of all chunks together are the same as postprocess_data() of the whole prediction array.
+
+        Args:
+            y (np.array): Predictions of the next frames with shape (n, 6, 21).
+
+        Returns:
+            np.array: Tabs of the chunk with shape (n, 3) and columns ('position', 'string', 'fret').
+        """
+        if y.ndim != 3 or y.shape[1] != 6 or y.shape[2] != 21:
+            raise ValueError(f"Data is in the wrong shape {y.shape} (expects (n, 6, 21)).")
+
+        r, self.last, n_positions = self._tabs(y, self.remove_duplicates, self.last, self.pos)
+        self.pos += n_positions
+
+        self.logger.debug(f"Fed {len(y)} frames, {len(r)} notes.")
+        return r
+
+
+    def flush(self) -> np.array:
+        """Ends the current recording and resets the streaming state for the next one.
+        feed() emits notes as soon as their frame arrives, so no notes are left to return.
+
+        Returns:
+            np.array: Remaining tabs with shape (0, 3).
+        """
+        self.logger.info(f"Flushed tabs with {self.pos} positions.")
+
+        self.last = None
+        self.pos = 0
+        return np.zeros((0, 3), dtype=np.int64)
+
+
+    def _tabs(self, y: np.array, remove_duplicates: bool, last: np.array = None, pos: int = 0) -> tuple:
+        """Converts predictions to tabs.
+
+        Args:
+            y (np.array): Predictions with shape (n, 6, 21).
+            remove_duplicates (bool): Skip frames that repeat the frets of the frame before.
+            last (np.array, optional): Classes of the frame before the first one in y. Defaults to None (y starts the recording).
+            pos (int, optional): Position of the first frame in the tabs. Defaults to 0.
+
+        Returns:
+            tuple: tabs with shape (n, 3), classes of the last frame, number of positions
+        """
+        # class per frame and string, 0 is "not played", fret = class - 1
+        classes = np.argmax(y, axis=-1)
+        played = classes > 0
+
+        # frames that start a new run on at least one string
+        new = np.ones(len(classes), dtype=bool)
+        if remove_duplicates and len(classes):
+            previous = np.concatenate([classes[:1] * 0 - 1 if last is None else last[np.newaxis], classes[:-1]])
+            new = np.any(classes != previous, axis=1)
+
+        # frames that end up in the tabs get consecutive positions
+        frames = new & played.any(axis=1)
+        positions = pos + np.cumsum(frames) - 1
+
+        # one row per played string of these frames, ordered by position and string
+        fidx, sidx = np.nonzero(played & frames[:, np.newaxis])
+        r = np.stack([positions[fidx], sidx, classes[fidx, sidx] - 1], axis=1)
+
+        return r, classes[-1] if len(classes) else last, int(frames.sum())
     
 
 def test():
@@ -233,7 +238,7 @@ def test():
     print(f"Mock results shape: {mock_results.shape}")
 
     p = PostProcessor(verbose=4)
-    results = p.postprocess_data(mock_data, mock_results)
+    results = p.postprocess_data(mock_data, test=mock_results)
 
     print(results)
 
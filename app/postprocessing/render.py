@@ -0,0 +1,106 @@
+                         ###################
+                        #                  #
+ #######               #  #  #####  #####  #   ###
+#       #      #      #   #     #      #   #  #   #
+ ###     #    # #    #    #    #      #    #  ####
+    #     #  #   #  #     #   #      #     #  #
+####       ##     ##      #  #####  #####  #   ###
+
+
+#############################################
+#                   IMPORTS                 #
+#############################################
+import numpy as np
+
+from profiling import profiled
+
+
+#############################################
+#                   CONSTANTS               #
+#############################################
+STRINGNAMES = ['E', 'A', 'D', 'G', 'B', 'e']
+
+
+@profiled('render')
+def render_text(tabs: np.array, positions_per_line: int = 16) -> str:
+    """Renders tabs as ASCII tablature, highest string on top.
+
+    Args:
+        tabs (np.array): Tabs with shape (n, 3) and columns ('position', 'string', 'fret') as returned by PostProcessor.postprocess_data().
+        positions_per_line (int, optional): Number of positions per line of tablature. Defaults to 16.
+
+    Returns:
+        str: ASCII tablature, one block of 6 lines per positions_per_line positions.
+    """
+    if len(tabs) == 0:
+        return ""
+
+    tabs = np.asarray(tabs, dtype=int)
+    n_positions = tabs[:, 0].max() + 1
+
+    # one cell per string and position, 2 characters wide (frets 0-19) plus separator
+    cells = np.full((len(STRINGNAMES), n_positions), '--', dtype='<U2')
+    cells[tabs[:, 1], tabs[:, 0]] = np.char.ljust(tabs[:, 2].astype(str), 2, '-')
+
+    blocks = []
+    for start in range(0, n_positions, positions_per_line):
+        block = cells[:, start:start + positions_per_line]
+        lines = [f"{STRINGNAMES[s]}|-" + "-".join(block[s]) + "-|" for s in reversed(range(len(STRINGNAMES)))]
+        blocks.append("\n".join(lines))
+
+    return "\n\n".join(blocks) + "\n"
+
+
+@profiled('render')
+def render_svg(tabs: np.array, start: int = 0, stop: int = None, positions_per_line: int = 10) -> str:
+    """Renders the positions start to stop of the tabs as one SVG image, highest string on top.
+    Only the notes of these positions are drawn, so the size of the image doesn't depend on the length of the song.
+
+    Args:
+        tabs (np.array): Tabs with shape (n, 3) and columns ('position', 'string', 'fret') as returned by PostProcessor.postprocess_data().
+        start (int, optional): First position. Defaults to 0.
+        stop (int, optional): Position after the last one. Defaults to None (last position of the tabs).
+        positions_per_line (int, optional): Number of positions per line of tablature. Defaults to 10.
+
+    Returns:
+        str: SVG image with one staff of 6 strings per positions_per_line positions.
+    """
+    tabs = np.reshape(np.asarray(tabs, dtype=int), (-1, 3))
+    if stop is None:
+        stop = tabs[:, 0].max() + 1 if len(tabs) else start
+
+    # tabs are sorted by position, select the notes of the page
+    notes = tabs[np.searchsorted(tabs[:, 0], start):np.searchsorted(tabs[:, 0], stop)]
+
+    # layout in pixels
+    n_strings = len(STRINGNAMES)
+    spacing, step, left, top = 24, 56, 60, 30
+    staff_height = (n_strings - 1) * spacing
+    line_height = staff_height + 2 * top
+    width = left + positions_per_line * step + step // 2
+    n_lines = max(1, -(-(stop - start) // positions_per_line))
+
+    svg = [f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {width} {n_lines * line_height}" width="100%" '
+           f'font-family="Arial" font-size="18" text-anchor="middle" dominant-baseline="central">',
+           f'<rect width="{width}" height="{n_lines * line_height}" fill="white"/>']
+
+    for line in range(n_lines):
+        y0 = line * line_height + top
+
+        # strings with their names and "TAB"
+        for s in range(n_strings):
+            y = y0 + (n_strings - 1 - s) * spacing
+            svg.append(f'<line x1="{left - 10}" y1="{y}" x2="{width - 10}" y2="{y}" stroke="black" stroke-width="1"/>')
+            svg.append(f'<text x="12" y="{y}" font-size="16">{STRINGNAMES[s]}</text>')
+        for i, letter in enumerate('TAB'):
+            svg.append(f'<text x="{left - 22}" y="{y0 + staff_height / 2 + (i - 1) * spacing}" font-weight="bold">{letter}</text>')
+
+    # frets on white circles
+    for position, string, fret in notes:
+        line, column = divmod(position - start, positions_per_line)
+        x = left + column * step + step // 2
+        y = line * line_height + top + (n_strings - 1 - string) * spacing
+        svg.append(f'<circle cx="{x}" cy="{y}" r="11" fill="white"/><text x="{x}" y="{y}">{fret}</text>')
+
+    svg.append('</svg>')
+    return "\n".join(svg)
@@ -0,0 +1,97 @@
+                         ###################
+                        #                  #
+ #######               #  #  #####  #####  #   ###
+#       #      #      #   #     #      #   #  #   #
+ ###     #    # #    #    #    #      #    #  ####
+    #     #  #   #  #     #   #      #     #  #
+####       ##     ##      #  #####  #####  #   ###
+
+
+#############################################
+#                   IMPORTS                 #
+#############################################
+import numpy as np
+
+from preprocessing.featurestore import FeatureStore
+
+
+#############################################
+#                   CONSTANTS               #
+#############################################
+CACHEPATH = '../data/cache/results/'
+
+
+class ResultCache(FeatureStore):
+
+    def __init__(self, model_version: str, path: str = CACHEPATH, max_size: float = 1, store_predictions: bool = False, verbose: int = 0) -> None:
+        """Generates an on-disk cache for the tabs of transcribed recordings, shared by all sessions and server processes.
+        Entries are keyed by the audio content, the preprocessing parameters, the frame gate and the model version,
+        and the least recently used ones are evicted when the cache grows beyond max_size (see FeatureStore).
+
+        Args:
+            model_version (str): Version of the model the tabs are predicted with, e.g. from model.inference.model_version().
+            path (str, optional): Path to the cache directory. Defaults to '../data/cache/results/'.
+            max_size (float, optional): Maximum size of the cache in GB. Defaults to 1.
+            store_predictions (bool, optional): Also store the predictions of the model. Defaults to False.
+            verbose (int, optional): Verbosity level of logger. Defaults to 0 (level: critical).
+        """
+        super().__init__(path, max_size, verbose)
+
+        self.model_version = model_version
+        self.store_predictions = store_predictions
+
+
+    def result_key(self, audiofile, p, gate=None, chunk_seconds: float = None) -> str:
+        """Returns the key of a recording transcribed with the given preprocessor and frame gate, in memory or streamed.
+        The gate works per chunk on streamed recordings, so their tabs can differ from the ones transcribed in memory.
+
+        Args:
+            audiofile (str, bytes or file-like): Path to the audio file, its content or an open audio file.
+            p (PreProcessor): PreProcessor the recording is preprocessed with.
+            gate (FrameGate, optional): Frame gate used for prediction. Defaults to None.
+            chunk_seconds (float, optional): Chunk length if the recording is streamed. Defaults to None (transcribed in memory).
+
+        Returns:
+            str: key of the recording
+        """
+        # read open files without moving their position
+        if hasattr(audiofile, 'read'):
+            position = audiofile.tell()
+            content = audiofile.read()
+            audiofile.seek(position)
+            audiofile = content
+
+        gate_params = None if gate is None else [gate.energy_threshold, gate.onset_threshold, gate.hold, gate.max_skip]
+
+        return self.key(audiofile, sr=p.sr, hop_length=p.hop_length, bins=p.bins, bins_per_octave=p.bins_per_octave,
+                        normalize=p.normalize, window_width=p.winwidth, dtype=p.dtype, gate=gate_params, stream=chunk_seconds,
+                        model=self.model_version)
+
+
+    def get_tabs(self, key: str) -> np.array:
+        """Returns the cached tabs of a recording, None if they are not in the cache.
+
+        Args:
+            key (str): Key of the recording, see result_key().
+
+        Returns:
+            np.array: Tabs with shape (n, 3) and columns ('position', 'string', 'fret').
+        """
+        cached = self.get(key)
+
+        return None if cached is None else np.array(cached[0]['tabs'])
+
+
+    def put_tabs(self, key: str, tabs: np.array, predictions: np.array = None):
+        """Stores the tabs and, if enabled, the predictions of a recording.
+
+        Args:
+            key (str): Key of the recording, see result_key().
+            tabs (np.array): Tabs with shape (n, 3) and columns ('position', 'string', 'fret').
+            predictions (np.array, optional): Predictions of the model with shape (n, 6, 21). Defaults to None.
+        """
+        arrays = {'tabs': np.reshape(tabs, (-1, 3))}
+        if self.store_predictions and predictions is not None:
+            arrays['predictions'] = predictions
+
+        self.put(key, arrays, {'model': self.model_version})
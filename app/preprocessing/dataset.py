@@ -0,0 +1,226 @@
+                         ###################
+                        #                  #
+ #######               #  #  #####  #####  #   ###
+#       #      #      #   #     #      #   #  #   #
+ ###     #    # #    #    #    #      #    #  ####
+    #     #  #   #  #     #   #      #     #  #
+####       ##     ##      #  #####  #####  #   ###
+
+
+#############################################
+#                   IMPORTS                 #
+#############################################
+import numpy as np
+import json
+import os
+import logging
+
+
+#############################################
+#                   CONSTANTS               #
+#############################################
+DATASETPATH = '../data/output/'
+SHARDSIZE = 8192
+
+
+class ShardedDataset:
+
+    def __init__(self, path: str = DATASETPATH, shard_size: int = SHARDSIZE, verbose: int = 0) -> None:
+        """Generates an appendable dataset of fixed-size, uncompressed .npy shards and a manifest.json.
+
+        Every array (e.g. 'windows' and 'windowlabels') is stored in its own shards named <array>_<shard>.npy,
+        each holding shard_size samples. The manifest keeps the number of samples, the shapes and dtypes of the
+        arrays and the sample range of every song and recording mode. Appending only writes to the last shard,
+        existing full shards are never rewritten. Shards are read memory-mapped.
+
+        Args:
+            path (str, optional): Path to the dataset directory. Defaults to '../data/output/'.
+            shard_size (int, optional): Number of samples per shard, only used for new datasets. Defaults to 8192.
+            verbose (int, optional): Verbosity level of logger. Defaults to 0 (level: critical).
+        """
+        self.path = path if path.endswith('/') else path + '/'
+
+        # setup logger
+        FORMAT = "[%(levelname)8s][%(filename)s:%(lineno)4s - %(funcName)20s() ] %(message)s"
+        logging.basicConfig(format=FORMAT)
+        verbosity = {0: logging.CRITICAL, 1: logging.ERROR, 2: logging.WARNING, 3: logging.INFO, 4: logging.DEBUG}
+        self.logger = logging.getLogger(__name__)
+        self.logger.setLevel(verbosity[verbose])
+
+        # load or initialize manifest
+        if os.path.exists(self.path + 'manifest.json'):
+            with open(self.path + 'manifest.json') as f:
+                self.manifest = json.load(f)
+            self.logger.info(f"Opened dataset {self.path} with {len(self)} samples from {len(self.songs)} songs.")
+        else:
+            self.manifest = {'shard_size': shard_size, 'n_samples': 0, 'arrays': {}, 'songs': [], 'meta': {}}
+
+
+    def __len__(self) -> int:
+        return self.manifest['n_samples']
+
+
+    @property
+    def shard_size(self) -> int:
+        return self.manifest['shard_size']
+
+
+    @property
+    def n_shards(self) -> int:
+        return -(-len(self) // self.shard_size)
+
+
+    @property
+    def songs(self) -> list:
+        """List of dicts with keys song, rec_mode, start and stop (sample range in the dataset)."""
+        return self.manifest['songs']
+
+
+    @property
+    def meta(self) -> dict:
+        """Metadata of the dataset, e.g. the settings it was generated with."""
+        return self.manifest['meta']
+
+
+    def contains(self, song: str, rec_mode: str) -> bool:
+        return any(s['song'] == song and s['rec_mode'] == rec_mode for s in self.songs)
+
+
+    def append(self, song: str, rec_mode: str, **arrays):
+        """Appends samples of one song to the dataset.
+
+        Args:
+            song (str): Song ID (e.g. filename without extension).
+            rec_mode (str): Recording mode of the song.
+            **arrays (np.ndarray): Arrays by name with the same number of samples, e.g. windows=..., windowlabels=...
+
+        Raises:
+            ValueError: If the names, shapes or dtypes of the arrays differ from the ones in the dataset.
+        """
+        n = len(next(iter(arrays.values())))
+
+        # first append defines arrays, shapes and dtypes
+        if not self.manifest['arrays']:
+            self.manifest['arrays'] = {name: {'shape': list(a.shape[1:]), 'dtype': str(a.dtype)} for name, a in arrays.items()}
+
+        if set(arrays) != set(self.manifest['arrays']):
+            raise ValueError(f"Dataset stores {list(self.manifest['arrays'])}, got {list(arrays)}.")
+
+        # check all arrays before anything is written, the shards would silently cast other dtypes
+        for name, array in arrays.items():
+            spec = self.manifest['arrays'][name]
+            if list(array.shape[1:]) != spec['shape'] or len(array) != n:
+                raise ValueError(f"Array {name} has shape {array.shape}, expected ({n}, {', '.join(map(str, spec['shape']))}).")
+            if str(array.dtype) != spec['dtype']:
+                raise ValueError(f"Array {name} has dtype {array.dtype}, dataset stores {spec['dtype']}.")
+
+        if not os.path.exists(self.path):
+            os.makedirs(self.path)
+
+        start = len(self)
+
+        for name, array in arrays.items():
+            # fill shards from the current end of the dataset
+            written = 0
+            while written < n:
+                shard, offset = divmod(start + written, self.shard_size)
+                count = min(n - written, self.shard_size - offset)
+                memmap = self._open_shard(name, shard, mode='r+' if offset else 'w+')
+                memmap[offset:offset + count] = array[written:written + count]
+                memmap.flush()
+                del memmap
+                written += count
+
+        # update manifest only after the data is written
+        self.manifest['n_samples'] = start + n
+        self.manifest['songs'].append({'song': song, 'rec_mode': rec_mode, 'start': start, 'stop': start + n})
+        self._write_manifest()
+
+        self.logger.info(f"Appended {n} samples of {song} ({rec_mode}) to {self.path}, now {len(self)} samples in {self.n_shards} shards.")
+
+
+    def set_meta(self, meta: dict):
+        """Stores metadata (e.g. preprocessing settings) in the manifest."""
+        self.manifest['meta'] = meta
+        self._write_manifest()
+
+
+    def shard(self, name: str, shard: int) -> np.array:
+        """Returns the filled part of a shard of an array as read-only memory map.
+
+        Args:
+            name (str): Name of the array.
+            shard (int): Index of the shard.
+
+        Returns:
+            np.ndarray: memory-mapped samples of the shard
+        """
+        stop = min(self.shard_size, len(self) - shard * self.shard_size)
+        return self._open_shard(name, shard, mode='r')[:stop]
+
+
+    def read(self, name: str, start: int = 0, stop: int = None) -> np.array:
+        """Reads a contiguous range of samples of an array into memory.
+
+        Args:
+            name (str): Name of the array.
+            start (int, optional): First sample. Defaults to 0.
+            stop (int, optional): Sample after the last one. Defaults to None (end of the dataset).
+
+        Returns:
+            np.ndarray: samples start to stop
+        """
+        stop = len(self) if stop is None else min(stop, len(self))
+        spec = self.manifest['arrays'][name]
+        out = np.empty((max(stop - start, 0), *spec['shape']), dtype=spec['dtype'])
+
+        pos = start
+        while pos < stop:
+            shard, offset = divmod(pos, self.shard_size)
+            count = min(stop - pos, self.shard_size - offset)
+            out[pos - start:pos - start + count] = self.shard(name, shard)[offset:offset + count]
+            pos += count
+
+        return out
+
+
+    def take(self, name: str, indices: np.array) -> np.array:
+        """Reads samples at arbitrary indices of an array into memory, reading every shard at most once.
+
+        Args:
+            name (str): Name of the array.
+            indices (np.ndarray): Sample indices.
+
+        Returns:
+            np.ndarray: samples in the order of indices
+        """
+        indices = np.asarray(indices)
+        spec = self.manifest['arrays'][name]
+        out = np.empty((len(indices), *spec['shape']), dtype=spec['dtype'])
+
+        shards = indices // self.shard_size
+        for shard in np.unique(shards):
+            mask = shards == shard
+            out[mask] = self.shard(name, shard)[indices[mask] - shard * self.shard_size]
+
+        return out
+
+
+    def _open_shard(self, name: str, shard: int, mode: str = 'r') -> np.memmap:
+        filename = self.path + f"{name}_{shard:05d}.npy"
+
+        if mode == 'w+':
+            spec = self.manifest['arrays'][name]
+            return np.lib.format.open_memmap(filename, mode='w+', dtype=spec['dtype'], shape=(self.shard_size, *spec['shape']))
+
+        return np.load(filename, mmap_mode=mode)
+
+
+    def _write_manifest(self):
+        if not os.path.exists(self.path):
+            os.makedirs(self.path)
+
+        # write to a temporary file first, so readers never see a half-written manifest
+        with open(self.path + 'manifest.json.tmp', 'w') as f:
+            json.dump(self.manifest, f, indent=1)
+        os.replace(self.path + 'manifest.json.tmp', self.path + 'manifest.json')
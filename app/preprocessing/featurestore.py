@@ -0,0 +1,153 @@
+                         ###################
+                        #                  #
+ #######               #  #  #####  #####  #   ###
+#       #      #      #   #     #      #   #  #   #
+ ###     #    # #    #    #    #      #    #  ####
+    #     #  #   #  #     #   #      #     #  #
+####       ##     ##      #  #####  #####  #   ###
+
+
+#############################################
+#                   IMPORTS                 #
+#############################################
+import numpy as np
+import hashlib
+import json
+import os
+import shutil
+import logging
+
+
+#############################################
+#                   CONSTANTS               #
+#############################################
+STOREPATH = '../data/cache/features/'
+
+
+class FeatureStore:
+
+    def __init__(self, path: str = STOREPATH, max_size: float = 10, verbose: int = 0) -> None:
+        """Generates a content-addressed on-disk store for arrays (e.g. CQT features).
+
+        Entries are directories named after their key, containing one uncompressed .npy file per array
+        and a meta.json file. Arrays are returned memory-mapped. When the store grows beyond max_size,
+        the least recently used entries are removed.
+
+        Args:
+            path (str, optional): Path to the store directory. Defaults to '../data/cache/features/'.
+            max_size (float, optional): Maximum size of the store in GB. Defaults to 10.
+            verbose (int, optional): Verbosity level of logger. Defaults to 0 (level: critical).
+        """
+        self.path = path if path.endswith('/') else path + '/'
+        self.max_size = int(max_size * 2**30)
+
+        # setup logger
+        FORMAT = "[%(levelname)8s][%(filename)s:%(lineno)4s - %(funcName)20s() ] %(message)s"
+        logging.basicConfig(format=FORMAT)
+        verbosity = {0: logging.CRITICAL, 1: logging.ERROR, 2: logging.WARNING, 3: logging.INFO, 4: logging.DEBUG}
+        self.logger = logging.getLogger(__name__)
+        self.logger.setLevel(verbosity[verbose])
+
+        if not os.path.exists(self.path):
+            os.makedirs(self.path)
+
+
+    def key(self, source, **params) -> str:
+        """Returns the key of a file (or its content) and the parameters it was processed with.
+
+        Args:
+            source (str or bytes): Path to a file or the content of a file.
+            **params: Parameters that change the stored arrays (e.g. sr, hop_length).
+
+        Returns:
+            str: sha1 hexdigest of content and parameters.
+        """
+        h = hashlib.sha1()
+
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            h.update(source)
+        else:
+            with open(source, 'rb') as f:
+                for block in iter(lambda: f.read(2**20), b''):
+                    h.update(block)
+
+        h.update(json.dumps(params, sort_keys=True, default=str).encode())
+
+        return h.hexdigest()
+
+
+    def get(self, key: str):
+        """Returns the arrays and metadata stored under key and marks the entry as recently used.
+
+        Args:
+            key (str): Key of the entry.
+
+        Returns tuple or None if key is not in the store:
+            arrays (dict): memory-mapped arrays by name
+            meta (dict): metadata of the entry
+        """
+        entry = self.path + key + '/'
+
+        if not os.path.exists(entry + 'meta.json'):
+            self.logger.debug(f"Key {key} not in store.")
+            return None
+
+        with open(entry + 'meta.json') as f:
+            meta = json.load(f)
+
+        arrays = {name: np.load(entry + name + '.npy', mmap_mode='r') for name in meta.pop('_arrays')}
+
+        # update access time for LRU eviction
+        os.utime(entry + 'meta.json')
+
+        self.logger.info(f"Loaded {list(arrays)} for key {key} from store.")
+        return arrays, meta
+
+
+    def put(self, key: str, arrays: dict, meta: dict = {}):
+        """Stores arrays and metadata under key and evicts least recently used entries if the store is too large.
+
+        Args:
+            key (str): Key of the entry.
+            arrays (dict): Arrays to store by name.
+            meta (dict, optional): JSON serializable metadata. Defaults to {}.
+        """
+        entry = self.path + key + '/'
+        tmp = self.path + '.' + key + f'.{os.getpid()}.tmp/'
+
+        # write to a temporary directory first, so readers never see half-written entries
+        os.makedirs(tmp, exist_ok=True)
+        for name, array in arrays.items():
+            np.save(tmp + name + '.npy', np.ascontiguousarray(array))
+        with open(tmp + 'meta.json', 'w') as f:
+            json.dump({**meta, '_arrays': list(arrays)}, f)
+
+        try:
+            os.rename(tmp, entry)
+            self.logger.info(f"Stored {list(arrays)} under key {key}.")
+        except OSError:
+            # entry was written concurrently by another process
+            shutil.rmtree(tmp, ignore_errors=True)
+
+        self._evict()
+
+
+    def _evict(self):
+        """Removes least recently used entries until the store is smaller than max_size."""
+
+        entries = []
+        for key in os.listdir(self.path):
+            entry = self.path + key + '/'
+            if key.startswith('.') or not os.path.exists(entry + 'meta.json'):
+                continue
+            size = sum(os.path.getsize(entry + f) for f in os.listdir(entry))
+            entries.append((os.path.getmtime(entry + 'meta.json'), size, entry))
+
+        total = sum(size for _, size, _ in entries)
+
+        for _, size, entry in sorted(entries):
+            if total <= self.max_size:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+            self.logger.info(f"Evicted {entry} from store ({size/2**20:.1f} MiB).")
@@ -0,0 +1,255 @@
+                         ###################
+                        #                  #
+ #######               #  #  #####  #####  #   ###
+#       #      #      #   #     #      #   #  #   #
+ ###     #    # #    #    #    #      #    #  ####
+    #     #  #   #  #     #   #      #     #  #
+####       ##     ##      #  #####  #####  #   ###
+
+
+#############################################
+#                   IMPORTS                 #
+#############################################
+import numpy as np
+import copy
+import os
+import time
+import logging
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+from preprocessing.prepro import PreProcessor, RECMODES, RSEED
+from preprocessing.dataset import ShardedDataset
+from profiling import Profiler, activate, stage
+
+
+class Funnel:
+
+    def __init__(self, p: PreProcessor, verbose: int = 0, f: str = None, workers: int = None, profiler: Profiler = None) -> None:
+        """Generates a funnel object that builds the training dataset by running a PreProcessor on many files in parallel.
+
+        Args:
+            p (PreProcessor): PreProcessor with the settings to use. Every job works on its own copy.
+            verbose (int, optional): Verbosity level of logger. Defaults to 0 (level: critical).
+            f (str, optional): Only use files containing this string (e.g. "solo" or "comp"). Defaults to None (all files).
+            workers (int, optional): Number of worker processes. Defaults to None (number of CPUs).
+            profiler (Profiler, optional): Profiler to record the stages of every job in, including the ones run in worker processes. Defaults to None.
+        """
+        self.p = p
+        self.verbose = verbose
+        self.filter = f
+        self.workers = workers or os.cpu_count()
+        self.timings = []
+        self.failed = []
+        self.profiler = profiler
+
+        # setup logger
+        FORMAT = "[%(levelname)8s][%(filename)s:%(lineno)4s - %(funcName)20s() ] %(message)s"
+        logging.basicConfig(format=FORMAT)
+        verbosity = {0: logging.CRITICAL, 1: logging.ERROR, 2: logging.WARNING, 3: logging.INFO, 4: logging.DEBUG}
+        self.logger = logging.getLogger(__name__)
+        self.logger.setLevel(verbosity[verbose])
+
+
+    def get_jobs(self, rec_modes: list = ['all'], subset: float = 1, filter: str = None) -> list:
+        """Returns the (filename, recording mode) jobs for the dataset.
+
+        Args:
+            rec_modes (list, optional): Recording modes to use (mm, mp, pd, po) or ['all']. Defaults to ['all'].
+            subset (float, optional): Fraction of files to use (0-1), sampled with a fixed seed. Defaults to 1.
+            filter (str, optional): Only use files containing this string. Defaults to the filter given at construction.
+
+        Returns:
+            list: List of (filename, rec_mode) tuples.
+        """
+        files = self.p.get_filenames()
+
+        # filter song modes
+        filter = filter if filter is not None else self.filter
+        if filter:
+            files = [f for f in files if filter in f]
+
+        # sample subset of files
+        if subset < 1:
+            rng = np.random.default_rng(RSEED)
+            files = sorted(rng.choice(files, size=max(1, int(len(files) * subset)), replace=False))
+
+        if 'all' in rec_modes:
+            rec_modes = list(RECMODES)
+
+        return [(f, rm) for f in files for rm in rec_modes]
+
+
+    def get_training_data(self, r: bool = False, save: bool = True, rec_modes: list = ['all'], subset: float = 1, filter: str = None, remove_noise: float = 0.95):
+        """Processes all jobs in a process pool. Results are appended to the sharded dataset in the output path as soon as a job is finished
+        and dropped afterwards, at most 2 jobs per worker are in flight. Jobs already in the dataset are skipped when the data is not returned. Failed jobs are skipped as well, they are
+        logged as critical at the end and stored in self.failed as (filename, recording mode, error).
+
+        Args:
+            r (bool, optional): Whether to return the data generated. Defaults to False.
+            save (bool, optional): Whether to save the data generated. Defaults to True.
+            rec_modes (list, optional): Recording modes to use (mm, mp, pd, po) or ['all']. Defaults to ['all'].
+            subset (float, optional): Fraction of files to use (0-1). Defaults to 1.
+            filter (str, optional): Only use files containing this string (e.g. "solo" or "comp"). Defaults to None.
+            remove_noise (float, optional): Fraction of empty windows to remove. Defaults to 0.95.
+
+        Raises:
+            ValueError: If the existing dataset was generated with different settings.
+
+        Returns tuple (only if r is True):
+            windows (np.ndarray): windows of all jobs
+            windowlabels (np.ndarray): labels of all jobs
+        """
+        jobs = self.get_jobs(rec_modes=rec_modes, subset=subset, filter=filter)
+
+        if save:
+            dataset = ShardedDataset(self.p.outputpath, verbose=self.verbose)
+
+            # songs in a dataset have to be processed with the same settings
+            settings = {'sr': self.p.sr, 'hop_length': self.p.hop_length, 'bins': self.p.bins, 'bins_per_octave': self.p.bins_per_octave,
+                        'normalize': self.p.normalize, 'window_width': self.p.winwidth, 'tuning': list(self.p.tuning), 'remove_noise': remove_noise,
+                        'dtype': self.p.dtype.name, 'label_dtype': self.p.label_dtype.name}
+            meta = dict(dataset.meta)
+            # datasets written before the dtypes were part of the settings, take them from the shards
+            if meta and 'dtype' not in meta and 'windows' in dataset.manifest['arrays']:
+                meta['dtype'] = dataset.manifest['arrays']['windows']['dtype']
+                meta['label_dtype'] = dataset.manifest['arrays']['windowlabels']['dtype']
+
+            if meta and meta != settings:
+                raise ValueError(f"Dataset {dataset.path} was generated with settings {meta}, not {settings}. Use another output path.")
+            dataset.set_meta(settings)
+
+            # append only new songs
+            if not r:
+                n_jobs = len(jobs)
+                jobs = [(f, rm) for f, rm in jobs if not dataset.contains(f.split('.')[0], RECMODES[rm])]
+                self.logger.info(f"Skipping {n_jobs - len(jobs)} jobs already in dataset {dataset.path}.")
+
+        self.logger.info(f"Processing {len(jobs)} jobs with {self.workers} workers.")
+
+        # workers get a copy of the PreProcessor without previous output
+        self.p.output = {}
+
+        # windows are built from the CQT frames in the main process, on a copy so the PreProcessor sent to the workers stays empty
+        windower = copy.copy(self.p)
+        windower.output = {}
+
+        windows, windowlabels = [], []
+        self.timings = []
+        self.failed = []
+        start = time.perf_counter()
+        done = 0
+
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+
+            # keep at most 2 jobs per worker in flight, so finished results don't pile up in memory
+            queue = list(reversed(jobs))
+            futures = {}
+
+            while queue or futures:
+                while queue and len(futures) < 2 * self.workers:
+                    filename, rec_mode = queue.pop()
+                    futures[executor.submit(_process_job, self.p, filename, rec_mode, remove_noise, self.profiler is not None)] = (filename, rec_mode)
+
+                finished, _ = wait(futures, return_when=FIRST_COMPLETED)
+
+                for future in finished:
+                    filename, rec_mode = futures.pop(future)
+                    done += 1
+
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        self.logger.error(f"[{done}/{len(jobs)}] {filename} ({rec_mode}) failed: {e}")
+                        self.failed.append((filename, rec_mode, repr(e)))
+                        continue
+
+                    # windows of the kept frames, a strided view on the CQT until they are selected
+                    windower._get_windows(result['data'], training=True)
+                    result_windows = windower.output['windows'] if result['kept_idx'] is None else windower.output['windows'][result['kept_idx']]
+                    windower.output = {}
+
+                    # the main process is the only writer of the dataset
+                    t = time.perf_counter()
+                    if save and not dataset.contains(result['song'], result['rec_mode']):
+                        with activate(self.profiler, file=f"{filename}:{rec_mode}"), stage('save'):
+                            dataset.append(result['song'], result['rec_mode'], windows=result_windows, windowlabels=result['windowlabels'])
+                    result['timings']['save'] = time.perf_counter() - t
+
+                    if self.profiler is not None:
+                        self.profiler.merge(result['records'])
+
+                    self.timings.append(result['timings'])
+
+                    if r:
+                        windows.append(np.ascontiguousarray(result_windows))
+                        windowlabels.append(result['windowlabels'])
+
+                    # progress and estimated time left
+                    elapsed = time.perf_counter() - start
+                    eta = elapsed / done * (len(jobs) - done)
+                    self.logger.info(f"[{done}/{len(jobs)}] {filename} ({rec_mode}): {result['n_windows']} windows in {result['timings']['total']:.1f}s "
+                                     f"(load {result['timings']['load']:.1f}s, audio {result['timings']['audio']:.1f}s, labels {result['timings']['labels']:.1f}s, save {result['timings']['save']:.1f}s). "
+                                     f"Elapsed: {elapsed:.0f}s, ETA: {eta:.0f}s.")
+
+                    del result, result_windows
+
+        self._log_timings(time.perf_counter() - start)
+
+        # logged at every verbosity, a run with failed jobs must not look like a successful one
+        if self.failed:
+            self.logger.critical(f"{len(self.failed)} of {len(jobs)} jobs failed (see Funnel.failed): "
+                                 + ", ".join(f"{f} ({rm})" for f, rm, _ in self.failed))
+
+        if r:
+            return np.concatenate(windows), np.concatenate(windowlabels)
+
+
+    def _log_timings(self, elapsed: float):
+        """Logs summary of the per-job timings of the last run.
+
+        Args:
+            elapsed (float): Wall time of the run in seconds.
+        """
+        if not self.timings:
+            self.logger.warning("No jobs finished.")
+            return
+
+        total = np.array([t['total'] for t in self.timings])
+        windows = sum(t['n_windows'] for t in self.timings)
+
+        self.logger.info(f"Finished {len(total)} jobs in {elapsed:.1f}s ({len(total)/elapsed:.2f} jobs/s, {windows/elapsed:.0f} windows/s).")
+        self.logger.info(f"Job time: mean {total.mean():.1f}s, median {np.median(total):.1f}s, max {total.max():.1f}s. Parallel speedup: {total.sum()/elapsed:.1f}x.")
+        for stage in ['load', 'audio', 'labels', 'save']:
+            self.logger.info(f"  {stage:>6}: {sum(t[stage] for t in self.timings):.1f}s total")
+
+
+def _process_job(p: PreProcessor, filename: str, rec_mode: str, remove_noise: float, profile: bool = False) -> dict:
+    """Runs the PreProcessor on one file and recording mode. Executed in a worker process.
+    Only the CQT frames are returned, the windows overlap 9 times and are built in the main process as views on them.
+
+    Returns:
+        dict: song ID, recording mode, number of windows, timings per stage, profiler records (if profile), CQT frames,
+            indices of the windows kept by remove_noise (None if all are kept) and labels.
+    """
+    profiler = Profiler() if profile else None
+    timings = {'file': filename, 'rec_mode': rec_mode}
+    t = time.perf_counter()
+
+    with activate(profiler, file=f"{filename}:{rec_mode}"):
+        audio, labels = p.load_files(filename, rec_mode=rec_mode)
+        timings['load'] = time.perf_counter() - t
+
+        p.preprocess_audio(audio, training=True)
+        timings['audio'] = time.perf_counter() - t - timings['load']
+
+        p.preprocess_labels(labels)
+        if remove_noise > 0:
+            p.remove_noise(fraction=remove_noise)
+        timings['labels'] = time.perf_counter() - t - timings['load'] - timings['audio']
+
+    timings['total'] = time.perf_counter() - t
+    timings['n_windows'] = len(p.output['windows'])
+
+    return {'song': p.curr_file, 'rec_mode': p.curr_rm, 'n_windows': timings['n_windows'], 'timings': timings,
+            'records': profiler.records if profile else [],
+            'data': np.ascontiguousarray(p.output['data']), 'kept_idx': p.output.get('kept_idx'), 'windowlabels': p.output['windowlabels']}
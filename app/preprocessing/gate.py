@@ -0,0 +1,166 @@
+                         ###################
+                        #                  #
+ #######               #  #  #####  #####  #   ###
+#       #      #      #   #     #      #   #  #   #
+ ###     #    # #    #    #    #      #    #  ####
+    #     #  #   #  #     #   #      #     #  #
+####       ##     ##      #  #####  #####  #   ###
+
+
+#############################################
+#                   IMPORTS                 #
+#############################################
+import numpy as np
+import logging
+
+
+#############################################
+#                   CONSTANTS               #
+#############################################
+ENERGY_THRESHOLD = -50.0
+ONSET_THRESHOLD = 0.1
+HOLD = 2
+MAX_SKIP = 20
+TOP_DB = 80.0
+
+
+class FrameGate:
+
+    def __init__(self, energy_threshold: float = ENERGY_THRESHOLD, onset_threshold: float = ONSET_THRESHOLD,
+                 hold: int = HOLD, max_skip: int = MAX_SKIP, n_strings: int = 6, n_classes: int = 21, verbose: int = 0) -> None:
+        """Selects the CQT frames that need a model prediction. Frames are skipped if they are silent (their
+        prediction is "not played" on every string) or if they lie within a sustained note (the last prediction is carried forward).
+
+        Args:
+            energy_threshold (float, optional): Frames with less energy (in dB relative to the loudest frame of the file) are silent. Defaults to -50.
+            onset_threshold (float, optional): Peaks of the onset strength (spectral flux, normalized to [0, 1] per file) above this threshold are onsets. Lower values predict more frames. Defaults to 0.1.
+            hold (int, optional): Number of frames after an onset that are predicted as well, while the attack is still inside the window. Defaults to 2.
+            max_skip (int, optional): A frame is predicted at least every max_skip frames, so carried-forward predictions don't drift too long. Defaults to 20.
+            n_strings (int, optional): Number of strings of the model output. Defaults to 6.
+            n_classes (int, optional): Number of classes per string of the model output ("not played" is class 0). Defaults to 21.
+            verbose (int, optional): Verbosity level of logger. Defaults to 0.
+        """
+        self.energy_threshold = energy_threshold
+        self.onset_threshold = onset_threshold
+        self.hold = hold
+        self.max_skip = max_skip
+        self.n_strings = n_strings
+        self.n_classes = n_classes
+
+        # setup logger
+        FORMAT = "[%(levelname)8s][%(filename)s:%(lineno)4s - %(funcName)20s() ] %(message)s"
+        logging.basicConfig(format=FORMAT)
+        verbosity = {0: logging.CRITICAL, 1: logging.ERROR, 2: logging.WARNING, 3: logging.INFO, 4: logging.DEBUG}
+        self.logger = logging.getLogger(__name__)
+        self.logger.setLevel(verbosity[verbose])
+
+
+    def features(self, data: np.array) -> tuple:
+        """Calculates frame energy and onset strength from CQT magnitudes.
+
+        Args:
+            data (np.ndarray): CQT magnitudes with shape (TIME, FREQUENCY), as in PreProcessor.output['data'].
+
+        Returns:
+            tuple: energy in dB relative to the loudest frame, onset strength in [0, 1] (both with shape (TIME,))
+        """
+        data = np.asarray(data, dtype=np.float32)
+
+        # frame energy, frames without any energy are at -inf
+        power = np.sum(np.square(data), axis=1)
+        energy = np.full(len(power), -np.inf, dtype=np.float32)
+        energy[power > 0] = 10 * np.log10(power[power > 0] / power.max())
+
+        # onset strength: mean increase of the log-magnitudes over all bins (spectral flux)
+        db = 20 * np.log10(np.maximum(data, 1e-10) / max(data.max(initial=0), 1e-10))
+        db = np.maximum(db, -TOP_DB)
+        onset = np.zeros(len(data), dtype=np.float32)
+        onset[1:] = np.mean(np.maximum(np.diff(db, axis=0), 0), axis=1)
+
+        # remove the baseline of stationary noise and scale the strongest onset to 1
+        onset = np.maximum(onset - np.median(onset) if len(onset) else onset, 0)
+        onset /= max(onset.max(initial=0), 1e-10)
+
+        return energy, onset
+
+
+    def select(self, data: np.array) -> tuple:
+        """Selects the frames that need a prediction.
+
+        Args:
+            data (np.ndarray): CQT magnitudes with shape (TIME, FREQUENCY), as in PreProcessor.output['data'].
+
+        Returns:
+            tuple: boolean masks (TIME,) of the frames to predict and of the frames that aren't silent
+        """
+        energy, onset = self.features(data)
+        n_frames = len(energy)
+        frames = np.arange(n_frames)
+
+        active = energy > self.energy_threshold
+
+        # onsets (peaks of the onset strength) and the first frame after silence
+        peaks = onset >= self.onset_threshold
+        peaks[1:] &= onset[1:] >= onset[:-1]
+        peaks[:-1] &= onset[:-1] > onset[1:]
+        trigger = active & peaks
+        trigger[:1] |= active[:1]
+        trigger[1:] |= active[1:] & ~active[:-1]
+
+        # hold the frames following an onset
+        selected = np.convolve(trigger, np.ones(self.hold + 1), mode='full')[:n_frames] > 0 if n_frames else trigger
+        selected &= active
+
+        # refresh sustained notes every max_skip frames
+        last = np.maximum.accumulate(np.where(selected, frames, -1))
+        gap = frames - last
+        selected |= active & (gap > 0) & (gap % self.max_skip == 0)
+
+        self.logger.info(f"Selected {selected.sum()} of {n_frames} frames for prediction ({np.sum(~active)} silent).")
+
+        return selected, active
+
+
+    def expand(self, y: np.array, selected: np.array, active: np.array) -> np.array:
+        """Expands the predictions of the selected frames to all frames. Silent frames are "not played" on every string,
+        the other skipped frames repeat the prediction of the last selected frame.
+
+        Args:
+            y (np.ndarray): Predictions of the selected frames with shape (SELECTED, STRINGS, CLASSES).
+            selected (np.ndarray): Mask of the selected frames, as returned by select().
+            active (np.ndarray): Mask of the frames that aren't silent, as returned by select().
+
+        Returns:
+            np.ndarray: Predictions of all frames with shape (TIME, STRINGS, CLASSES).
+        """
+        not_played = np.zeros((1, self.n_strings, self.n_classes), dtype=np.asarray(y).dtype)
+        not_played[..., 0] = 1
+
+        # index of the last selected frame in y, -1 (not played) for silent frames
+        # every run of active frames starts with a selected frame, so active frames never point in front of y
+        source = np.cumsum(selected) - 1
+        source[~active] = -1
+
+        return np.concatenate([y, not_played], axis=0)[source]
+
+
+    def predict(self, model, data: np.array, windows: np.array) -> np.array:
+        """Predicts the selected frames of a file with the model and expands the predictions to all frames.
+
+        Args:
+            model (keras.Model or TFLiteModel): Loaded swizzle model.
+            data (np.ndarray): CQT magnitudes with shape (TIME, FREQUENCY), as in PreProcessor.output['data'].
+            windows (np.ndarray): Windows of all frames, as in PreProcessor.output['windows'].
+
+        Returns:
+            np.ndarray: Predictions of all frames with shape (TIME, STRINGS, CLASSES).
+        """
+        selected, active = self.select(data)
+
+        if selected.any():
+            # add the channel axis, the model is warmed up with (BATCH, BINS, WIDTH, 1) inputs
+            y = model.predict(windows[selected][..., np.newaxis], verbose=0)
+        else:
+            y = np.zeros((0, self.n_strings, self.n_classes), dtype=np.float32)
+
+        return self.expand(y, selected, active)
@@ -11,12 +11,16 @@
 #                   IMPORTS                 #
 #############################################
 import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
 import librosa
-import librosa.display
-import jams
+import soundfile as sf
 import os
 import logging
 
+from preprocessing.featurestore import FeatureStore
+from preprocessing.dataset import ShardedDataset
+from profiling import stage, profiled
+
 
 #############################################
 #                   CONSTANTS               #
@@ -27,6 +31,7 @@ RECMODES = {'mm': '_mic', 'mp': '_mix', 'pd': '_hex_cln', 'po': '_hex'}
 LABELPATH = '../data/raw/annotation/'
 OUTPUTPATH = '../data/output/'
 STANDARDE = [40, 45, 50, 55, 59, 64]
+RSEED = 42
 
 
 class PreProcessor:
@@ -34,7 +39,8 @@ class PreProcessor:
     def __init__(self, audiopath: str = AUDIOPATH, labelpath: str = LABELPATH, outputpath: str = OUTPUTPATH,
                  tuning: list = STANDARDE, frets: int = 19,
                  hop_length: int = 512, bins: int = 192, bins_per_octave: int = 24, sr: int = 22050, normalize: bool = True, 
-                 window_width: int = 9, verbose: int = 0) -> None:
+                 window_width: int = 9, dtype: str = 'float32', label_dtype: str = 'float32',
+                 store: FeatureStore = None, verbose: int = 0) -> None:
         """Generates a preprocessing object
 
         Args:
@@ -47,6 +53,10 @@ class PreProcessor:
             bpo (int, optional): Bins per octave parameter for CQT. Defaults to 24.
             sr (int, optional): Sampling rate parameter for CQT. Defaults to 22050.
             normalize (bool, optional): Normalize amplitudes of audiofiles. Defaults to True.
+            window_width (int, optional): Width of the sliding windows in frames. Defaults to 9.
+            dtype (str, optional): dtype of CQT magnitudes and windows (e.g. float32 or float16). Defaults to float32.
+            label_dtype (str, optional): dtype of one-hot labels (e.g. float32, float16 or uint8). Defaults to float32.
+            store (FeatureStore, optional): Feature store to cache CQTs of loaded files in. Defaults to None (no caching).
             verbose (int, optional): Verbosity level of logger. Defaults to 3 (level: debug).
         """
 
@@ -73,9 +83,17 @@ class PreProcessor:
         # preprocessing settings
         self.winwidth = window_width
 
+        # storage settings
+        self.dtype = np.dtype(dtype)
+        self.label_dtype = np.dtype(label_dtype)
+        self.store = store
+
         # output settings
         self.curr_file = ""
         self.curr_rm = ""
+        self.curr_key = ""
+        self.curr_audiofile = ""
+        self._cached = None         # stored arrays of the file last loaded with load_files(), if it is in the feature store
         self.n_classes = self.n_frets + 2
         self.output = {}
 
@@ -118,10 +136,14 @@ class PreProcessor:
             rec_mode (str): Either mm, mp, pd, or po (mono_mic, mono_pickup, pickup_debleeded, or pickup_original). Defaults to mm.
 
         Returns tuple:
-            audio (np.ndarray): librosa object containing audio
+            audio (np.ndarray or None): librosa object containing audio, None if the CQT of the file is in the feature store
+                (the audio isn't decoded then, pass the None on to preprocess_audio(), which loads the stored CQT)
             labels (jams.JAMS): jams object containing labels
         """
 
+        # jams is only needed for training data, import it here to keep startup of inference fast
+        import jams
+
         # get recording-style path and mode
         rp = RECPATHS[rec_mode]
         rm = RECMODES[rec_mode]
@@ -134,202 +156,298 @@ class PreProcessor:
         # save current filename and recording mode for output files
         self.curr_file = filename
         self.curr_rm = rm
+        self.curr_audiofile = audiofile
+        self._cached = None
+
+        # skip decoding if the CQT of this file is already in the feature store
+        if self.store is not None:
+            self.curr_key = self.store.key(audiofile, sr=self.sr, hop_length=self.hop_length, bins=self.bins,
+                                           bins_per_octave=self.bins_per_octave, normalize=self.normalize, dtype=self.dtype)
+            cached = self.store.get(self.curr_key)
+
+            if cached is not None:
+                # keep the (memory-mapped) arrays, the entry can be evicted by another process before preprocess_audio()
+                self._cached = cached[0]
+                self.audiolength = cached[1]['audiolength']
+                self.logger.info(f"Found CQT of {audiofile} in feature store, loading {labelfile}.")
+                with stage('labeling'):
+                    return None, jams.load(labelfile)
 
         # extract audio
-        audio, _ = librosa.load(audiofile, sr=self.sr, dtype=np.float32, mono=True)
+        with stage('decode'):
+            audio, _ = librosa.load(audiofile, sr=self.sr, dtype=np.float32, mono=True)
 
         # save audio length
         self.audiolength = librosa.get_duration(y=audio, sr=self.sr, hop_length=self.hop_length)
 
         self.logger.info(f"Loading files {audiofile} and {labelfile}.")
-        return audio, jams.load(labelfile)
+        with stage('labeling'):
+            return audio, jams.load(labelfile)
 
 
     def preprocess_audio(self, data: np.array, training: bool = False):
         """Normalizes audio, calculates CQT and hands data over to _get_windows() for sliding window generation. Data is stored in self.output['data'].
+        If the file loaded with load_files() is in the feature store, the CQT found by load_files() is used instead.
 
         Args:
-            data (np.ndarray): Audio data as np.ndarray.
+            data (np.ndarray): Audio data as np.ndarray. Can be None if the CQT is in the feature store.
 
         """
-        # Ensure data has dtype float
-        data = data.astype(float)
+        # the key and stored arrays belong to the file last loaded with load_files()
+        key, self.curr_key = self.curr_key, ""
+        cached, self._cached = self._cached, None
 
-        # Normalize
-        if self.normalize:
-            data = librosa.util.normalize(data)
+        if cached is not None:
+            self.output['data'] = cached['data']
 
-        # ConstantQ transformation
-        data = np.abs(librosa.cqt(data, sr=self.sr, hop_length=self.hop_length, n_bins=self.bins, bins_per_octave=self.bins_per_octave))
+        else:
+            if data is None:
+                # no audio and no stored CQT, decode the file last loaded with load_files()
+                self.logger.warning(f"CQT of {self.curr_audiofile} is not in the feature store anymore, decoding it.")
+                with stage('decode'):
+                    data, _ = librosa.load(self.curr_audiofile, sr=self.sr, dtype=np.float32, mono=True)
 
-        # Swapping axes so arrays are "across frequency bins" instead of "along timepoints"
-        self.output['data'] = np.swapaxes(data, 0, 1)
+            # Ensure data has dtype float32 (librosa loads float32, no need to upcast)
+            data = np.asarray(data, dtype=np.float32)
+
+            # Normalize
+            if self.normalize:
+                data = librosa.util.normalize(data)
+
+            # ConstantQ transformation
+            self.output['data'] = self._cqt(data)
+
+            if self.store is not None and key:
+                self.store.put(key, {'data': self.output['data']}, {'audiolength': self.audiolength})
 
         # get data windows
         self._get_windows(self.output['data'], training)
-        
 
-    def preprocess_labels(self, labels: jams.JAMS):
-        
-        notes_played = []
 
-        # get midi notes played per string
-        for string, data in enumerate(labels.annotations['note_midi']):
-            for observation in range(len(data['data'])):
-                notes_played.append([string, np.round(data['data'][observation][2]), data['data'][observation][0]])
-        
-        # sort ascending by time
-        notes_played = np.array(sorted(notes_played, key=lambda x: x[-1]))
-        
-        # store labels
-        self.output['labels'] = labels
+    def stream_audio(self, audiofile: str, training: bool = False, chunk_seconds: float = 30):
+        """Streaming version of load_files() and preprocess_audio() for long recordings. Audio is decoded in blocks and the CQT is
+        calculated over overlapping chunks, so peak memory depends on chunk_seconds and not on the length of the recording.
+        Windows are yielded chunk by chunk and nothing is stored in self.output.
 
-        # get label windows
-        self._get_windowlabels(notes_played)
+        Every chunk is extended by the length of the longest CQT filter on both sides and only the frames
+        not affected by the chunk boundaries are kept, so the frames match the ones of a CQT over the whole file.
+        The first and last chunk end at the file edges instead, so librosa pads them the same way as the whole file.
+
+        Args:
+            audiofile (str): Path to the audio file.
+            training (bool, optional): indicate whether training data is generated or user data is processed. Defaults to False.
+            chunk_seconds (float, optional): Length of audio processed at once in seconds. Defaults to 30.
+
+        Yields:
+            np.ndarray: Windows of the next chunk in portrait layout (TIME, FREQUENCY, WIDTH).
+        """
+        with sf.SoundFile(audiofile) as f:
+
+            # audio length and number of frames after resampling to self.sr
+            n_samples = int(np.ceil(f.frames * self.sr / f.samplerate))
+            n_frames = 1 + n_samples // self.hop_length
+            self.audiolength = n_samples / self.sr
+
+            # context needed on each side of a chunk: length of the longest (lowest) CQT filter
+            fmin = librosa.note_to_hz('C1')
+            filter_length = (1 / (2 ** (1 / self.bins_per_octave) - 1)) * self.sr / fmin
+            ctx_frames = int(np.ceil(filter_length / self.hop_length))
+            ctx = ctx_frames * self.hop_length
+            chunk_frames = max(self.winwidth, int(chunk_seconds * self.sr / self.hop_length))
+            chunk = chunk_frames * self.hop_length
+
+            # first pass: peak amplitude of the resampled audio for normalization,
+            # chunks are resampled with context so the peak doesn't include the ringing of the resampler at the chunk edges
+            scale = 1
+            if self.normalize:
+                peak = 0
+                for c0 in range(0, n_samples, chunk):
+                    c1 = min(c0 + chunk, n_samples)
+                    s0, s1 = max(c0 - ctx, 0), min(c1 + ctx, n_samples)
+                    block = self._read_resampled(f, s0, s1)[c0 - s0:c1 - s0]
+                    peak = max(peak, np.max(np.abs(block), initial=0))
+                scale = 1 / peak if peak > 0 else 1
+
+            self.logger.info(f"Streaming {audiofile}: {n_frames} frames in chunks of {chunk_frames} frames (+{ctx_frames} frames context).")
+
+            # half-width of window and frames carried over to the next chunk
+            half_width = self.winwidth//2
+            carry = np.zeros((half_width, self.bins), dtype=self.dtype)
+
+            for f0 in range(0, n_frames, chunk_frames):
+                f1 = min(f0 + chunk_frames, n_frames)
+
+                # samples needed at self.sr, cut at the file edges
+                s0 = max(f0 * self.hop_length - ctx, 0)
+                s1 = min(f1 * self.hop_length + ctx, n_samples)
 
+                with stage('decode'):
+                    block = self._read_resampled(f, s0, s1) * scale
 
-    def _pad_frame(self, data: np.array, pad_left: bool):
-        """Padding function to account for windows which left or right bounds are < 0 or > len(data)
+                # keep frames f0 to f1, which are centered at least ctx samples from the chunk edges or at the file edges
+                first = f0 - s0 // self.hop_length
+                data = self._cqt(block)[first:first + f1 - f0]
+
+                self.logger.info(f"Processed frames {f0}-{f1}/{n_frames}.")
+
+                if training:
+                    # prepend frames of the last chunk and append zero padding after the last chunk
+                    data = np.concatenate([carry, data], axis=0)
+                    if f1 == n_frames:
+                        data = np.pad(data, ((0, half_width), (0, 0)))
+                    carry = data[len(data) - 2 * half_width:]
+                    yield sliding_window_view(data, self.winwidth, axis=0)
+
+                else:
+                    yield np.broadcast_to(data[:, :, np.newaxis], (data.shape[0], self.bins, self.winwidth))
+
+
+    def _read_resampled(self, f: sf.SoundFile, s0: int, s1: int) -> np.array:
+        """Reads samples s0 to s1 (at self.sr) of an open audio file as mono audio, resampled from the native sampling rate.
 
         Args:
-            input (list): frame to be padded
-            width (int, optional): Window width. Defaults to 9.
-            left (bool, optional): Left or right padding. Defaults to True.
+            f (sf.SoundFile): Open audio file.
+            s0 (int): First sample at self.sr.
+            s1 (int): Sample after the last one at self.sr.
 
         Returns:
-            list: the padded input.
+            np.ndarray: Audio data with s1 - s0 samples.
         """
-        orig_width = len(data)
-        padding = self.winwidth - orig_width
+        ratio = self.sr / f.samplerate
+        n0 = int(np.floor(s0 / ratio))
+        n1 = min(int(np.ceil(s1 / ratio)), f.frames)
 
-        
-        if padding == 0:
-            return data
+        f.seek(n0)
+        block = f.read(frames=n1 - n0, dtype='float32', always_2d=True).mean(axis=1)
 
-        else:
-            self.logger.info(f" --> Padding a window of width {orig_width}. Padding size: {padding}.")
-            
-        if pad_left:
-            data = np.concatenate([[np.zeros((self.bins,))] * padding, data], axis=0)
+        # resample and align first sample with s0
+        if f.samplerate != self.sr:
+            block = librosa.resample(block, orig_sr=f.samplerate, target_sr=self.sr)
+        offset = int(round(s0 - n0 * ratio))
+        return librosa.util.fix_length(block[offset:offset + s1 - s0], size=s1 - s0)
 
-        else:
-            data = np.concatenate([data, [np.zeros((self.bins,))] * padding], axis=0)
 
-        return data
+    @profiled('cqt')
+    def _cqt(self, data: np.array) -> np.array:
+        """Calculates CQT magnitudes of normalized audio data.
+
+        Args:
+            data (np.ndarray): Audio data as np.ndarray.
+
+        Returns:
+            np.ndarray: CQT magnitudes with shape (TIME, FREQUENCY) in self.dtype.
+        """
+        data = np.abs(librosa.cqt(data, sr=self.sr, hop_length=self.hop_length, n_bins=self.bins, bins_per_octave=self.bins_per_octave))
+
+        # store magnitudes in the compact dtype
+        data = data.astype(self.dtype, copy=False)
 
+        # Swapping axes so arrays are "across frequency bins" instead of "along timepoints"
+        return np.swapaxes(data, 0, 1)
 
+
+    @profiled('labeling')
+    def preprocess_labels(self, labels: 'jams.JAMS', sustain: bool = False):
+        """Extracts played notes from the 'note_midi' annotations and hands them over to _get_windowlabels() for label window generation.
+
+        Args:
+            labels (jams.JAMS): jams object containing labels
+            sustain (bool, optional): Also label windows in which a note is still ringing, not only the ones in which it starts. Defaults to False.
+        """
+
+        notes_played = []
+
+        # get midi notes played per string with their start and end time
+        for string, data in enumerate(labels.annotations['note_midi']):
+            intervals, values = data.to_interval_values()
+            notes = np.zeros((len(values), 4))
+            notes[:, 0] = string
+            notes[:, 1] = np.round(values)
+            notes[:, 2:] = intervals
+            notes_played.append(notes)
+
+        # sort ascending by start time
+        notes_played = np.concatenate(notes_played, axis=0) if notes_played else np.zeros((0, 4))
+        notes_played = notes_played[np.argsort(notes_played[:, 2], kind='stable')]
+
+        # store labels
+        self.output['labels'] = labels
+
+        # get label windows
+        self._get_windowlabels(notes_played, sustain)
+
+
+    @profiled('windowing')
     def _get_windows(self, data: np.array, training: bool = False):
         """Sliding window function to extract windows with set width from an input array. Windows are stored in self.output['windows'].
 
+        The input is padded once and all windows are returned as a strided view on the padded array,
+        so no window is copied and the Python overhead is constant per file.
+
         Args:
             data (np.ndarray): preprocessed audio data
             training (bool): indicate whether training data is generated or user data is processed. Defaults to False.
 
         """
 
-        # initialize windows array
-        # windows = np.zeros(shape=(data.shape[0], self.winwidth, self.bins)) # Landscape
-        windows = np.zeros(shape=(data.shape[0], self.bins, self.winwidth)) # Portrait
+        self.logger.info(f"Training data: {training}")
 
         if training:
 
-            self.logger.info(f"Training data: {training}")
             # calculate half-width of window
             half_width = self.winwidth//2
 
-
             # Data is in format: TIME x FREQUENCY
-            # Loop over the different timepoints and save windows that are 9 timepoints wide,
-            # centered around the current timepoint. If no 9 timepoints are available
-            # (left and right edge), pad the windows accordingly.
-            #
-            # Pseudocode:
-            # 
-            # 1. get current timepoint
-            # 2. calculate left and right timepoints (-+ half_width)
-            # 3. if either is < 0 or > len(data) --> padding
-            # 4. Padding means adding winwidth - lbound zero-arrays
-
-            # f_idx/fbin: different frequency bins
-            # t_idx/tpoint: different timepoints
-            for t_idx in range(data.shape[0]):
-                # set left and right bounds, so that item at t_idx is centered
-                lbound = t_idx - half_width
-                rbound = t_idx + half_width + 1
-
-                self.logger.info(f"Extracting window {t_idx}/{len(data)-1}. Frames: {lbound, rbound}", )
-
-                # if bounds > 0 and < len(data), simply extract window
-                if lbound >= 0 and rbound < data.shape[0]:
-                    windows[t_idx] = data[lbound:rbound].T
-                
-                # if left bound below zero, pad left
-                elif lbound < 0:
-                    windows[t_idx] = self._pad_frame(data[0:rbound], True).T
-
-                # if right bound greater than input length, pad right
-                elif rbound >= data.shape[0]:
-                    windows[t_idx] = self._pad_frame(data[lbound:], False).T
+            # Pad half_width zero frames on both edges, so that every timepoint has a window
+            # that is 9 timepoints wide and centered around it. Windows are then read out as a
+            # strided view of shape (TIME, FREQUENCY, WIDTH), i.e. the portrait layout.
+            padded = np.pad(data, ((half_width, half_width), (0, 0)))
+            windows = sliding_window_view(padded, self.winwidth, axis=0)
 
         else:
 
-            self.logger.info(f"Training data: {training}")
-            # construct arrays for each frame over all frequency bins
-            for idx, frame in enumerate(self.output['data']):
-                self.logger.info(f"Processing user audio data frame {idx}/{len(data)-1}.")
-                windows[idx] = np.swapaxes([frame] * 9, 0, 1)
+            # repeat each frame over the window width without copying it
+            windows = np.broadcast_to(data[:, :, np.newaxis], (data.shape[0], self.bins, self.winwidth))
 
+        self.logger.info(f"Extracted {windows.shape[0]} windows of shape {windows.shape[1:]}.")
 
         self.output['windows'] = windows
 
 
-    def _get_windowfrets(self, windowlabels, n_windows: int):
+    def _get_windowfrets(self, notes: np.array, window_idx: np.array, n_windows: int):
         """Converts MIDI note values to fret positions in a 6x21 array. Windows are stored in self.output['windowlabels'].
 
         Args:
-            windowlabels (list): list with windowlabels
+            notes (np.ndarray): notes with columns STRING MIDI, one row per (window, note) pair
+            window_idx (np.ndarray): window index of each row in notes
             n_windows (int): number of windows
         """
 
         # initialize windows array
-        windows = np.zeros(shape=(n_windows, self.n_strings, self.n_classes))
-    
+        windows = np.zeros(shape=(n_windows, self.n_strings, self.n_classes), dtype=self.label_dtype)
+
         # 1: get string played
         # 2: get empty string midi value (esmv)
-        # 3: subtract esmv from played note midi value
-        # 3.1: if fret played is 0,
-        # 4: replace respective value in fretboard
+        # 3: subtract esmv from played note midi value, +1 as index 0 means "not played"
+        # 4: set all (window, string, fret) positions in one assignment
         # 5: set first value to 1, if all other values are 0
+        strings = notes[:, 0].astype(int)
+        frets = (notes[:, 1] - np.asarray(self.tuning)[strings] + 1).astype(int)
+        windows[window_idx, strings, frets] = 1
+
+        # strings without a note in a window were not played
+        windows[~windows.any(axis=-1), 0] = 1
 
-        for widx, window in enumerate(windowlabels):
-            self.logger.info(f"Current window: {widx, np.reshape(window, (len(window)*2,))}")
-            if window.size > 0:
-                # empty string midi value from string played (0-5)
-                for item in window:
-                    esmv = self.tuning[item[0].astype(int)]
-                    # convert played note to fret
-                    fret = (item[1] - esmv + 1).astype(int)
-                    # set fret to 1 in fretboard
-                    windows[widx][item[0].astype(int)][fret] = 1
-        
-            # if no note was played in window, set first values to 1
-            elif window.size == 0: 
-                for idx in range(len(windows[widx])):
-                    windows[widx][idx][0] = 1 
-
-        for widx in range(len(windows)):
-            for idx, string in enumerate(windows[widx]):
-                if sum(string) == 0:
-                    windows[widx][idx][0] = 1
-            
         # store in output
         self.output['windowlabels'] = windows
 
-    def _get_windowlabels(self, labels):
-        """Sliding window function to extract windows with set width from an input array.
+
+    def _get_windowlabels(self, labels: np.array, sustain: bool = False):
+        """Assigns notes to the windows they fall into, using binary search over the sorted note start times.
 
         Args:
-            labels (np.ndarray): preprocessed label data
+            labels (np.ndarray): preprocessed label data with columns STRING MIDI STARTTIME ENDTIME, sorted by STARTTIME
+            sustain (bool, optional): Also assign notes that started before a window but are still ringing in it. Defaults to False.
 
         """
 
@@ -343,101 +461,113 @@ class PreProcessor:
         # calculate half-width of window
         half_width = self.winwidth//2
 
-        # Data has columns: STRING MIDI STARTTIME
-        # Check if note was played or is still ringing within a window's start and endtime.
-        # Collect all notes for which this is true and save as windowlabels.
-        # Repeat this for all windows
-
-        windows = []
+        # left and right timebounds for all windows
+        widx = np.arange(n_windows)
+        lbounds = (widx - half_width) / n_windows * self.audiolength
+        rbounds = (widx + half_width) / n_windows * self.audiolength
+
+        # Notes are sorted by start time, so the notes starting within a window are
+        # the contiguous range [start, stop) found by searchsorted on the start times.
+        # For sustained notes the running maximum of the end times is sorted as well and
+        # gives the first note that may still be ringing; the range is filtered afterwards.
+        stop = np.searchsorted(labels[:, 2], rbounds, side='right')
+        if sustain:
+            start = np.searchsorted(np.maximum.accumulate(labels[:, 3]), lbounds, side='left')
+        else:
+            start = np.searchsorted(labels[:, 2], lbounds, side='left')
 
-        for w in range(n_windows):
+        # expand ranges into (window, note) pairs
+        counts = np.clip(stop - start, 0, None)
+        window_idx = np.repeat(widx, counts)
+        note_idx = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts) + np.repeat(start, counts)
 
-            # calculate left and right timebounds for current window
-            lbound = ((w-half_width) / n_windows * self.audiolength)
-            rbound = ((w+half_width) / n_windows * self.audiolength)
+        if sustain:
+            ringing = labels[note_idx, 3] >= lbounds[window_idx]
+            window_idx, note_idx = window_idx[ringing], note_idx[ringing]
 
-            self.logger.debug(f"Current timeframe: {np.round(lbound, 3):.3f} - {np.round(rbound, 3):.3f} / {np.round(self.audiolength, 3):.3f}")
+        self.logger.info(f"Assigned {len(note_idx)} notes to {n_windows} windows.")
 
-            # mask labels based on time column (index: 2)
-            mask = ((labels[:, 2] >= lbound) & (labels[:, 2] <= rbound))
-            windows.append(labels[mask, :-1])
-            self.logger.debug(f"Found labels: {labels[mask, :-1]}")
-        
-        self._get_windowfrets(windows, n_windows)
+        self._get_windowfrets(labels[note_idx, :2], window_idx, n_windows)
 
 
-    def remove_noise(self, fraction: float = 0.95):
+    def remove_noise(self, fraction: float = 0.95, seed: int = RSEED) -> np.array:
         """Method to remove windows with no labels (i.e. timepoints in a song where no new note was played)
 
+        The removed windows are drawn at random over the whole file, so the remaining empty windows are not biased
+        towards the end of the song. With the same seed the same windows are removed.
+
         Args:
             fraction (float, optional): Fraction of the empty windows to be removed. Defaults to 0.95.
-        """
-        noise_frames_idx = []
-        data_frames_idx = []
-
-        # loop through all frames to find empty frames
-        for fidx, frame in enumerate(self.output['windowlabels']):
-            
-            null_strings = 0
+            seed (int, optional): Seed of the random generator used to pick the removed windows. Defaults to 42.
 
-            # loop over all strings in frame
-            for string in frame:
+        Returns:
+            np.ndarray: Sorted indices of the kept windows, also stored in self.output['kept_idx'].
+        """
 
-                # read out indices of '1's
-                zero_idx = np.where(string==1)
+        # a frame is empty if every string is "not played" (1 at position 0)
+        empty = np.all(self.output['windowlabels'][..., 0] == 1, axis=-1)
+        noise_frames_idx = np.flatnonzero(empty)
 
-                # if '1' is at position 0, increase null_string counter
-                if np.squeeze(zero_idx).size == 1 and np.squeeze(zero_idx) == 0:
-                    null_strings += 1
+        # randomly pick the empty frames to remove
+        rng = np.random.default_rng(seed)
+        removed_idx = rng.choice(noise_frames_idx, size=int(len(noise_frames_idx)*fraction), replace=False)
 
-            # check if all strings were not played
-            if null_strings == 6:
-                noise_frames_idx.append(fidx)
-            else:
-                data_frames_idx.append(fidx)
-        
         # creating mask
         mask = np.ones(len(self.output['windows']), dtype=bool)
-        noise_frames_idx = noise_frames_idx[:int(len(noise_frames_idx)*fraction)]
-        mask[noise_frames_idx] = False
+        mask[removed_idx] = False
+        kept_idx = np.flatnonzero(mask)
 
-        # remove found indices from windows and windowlabels via masking
-        self.output['windows'] = self.output['windows'][mask]
-        self.output['windowlabels'] = self.output['windowlabels'][mask]
+        self.logger.info(f"Removing {len(removed_idx)} of {len(noise_frames_idx)} empty windows, keeping {len(kept_idx)} windows.")
 
+        # remove found indices from windows and windowlabels
+        self.output['windows'] = self.output['windows'][kept_idx]
+        self.output['windowlabels'] = self.output['windowlabels'][kept_idx]
+        self.output['kept_idx'] = kept_idx
 
-    def save_output(self, path: str = "", suffix: list = ['data', 'labels']):
-        """Saves data and labels stored as .npz files.
+        return kept_idx
+
+
+    def save_output(self, path: str = "", dataset: ShardedDataset = None):
+        """Appends windows and labels of the current file to a sharded dataset (see ShardedDataset).
 
         Args:
-            path (str, optional): Path to save files to. If directory doesn't exist, it will be created. Defaults to '../data/output/'.
-            suffix (list, optional): Suffixes for data and labels files. Defaults to ['data', 'labels'].
+            path (str, optional): Path of the dataset. If directory doesn't exist, it will be created. Defaults to '../data/output/'.
+            dataset (ShardedDataset, optional): Dataset to append to. Defaults to the dataset at path.
         """
-        # create directory
-        if not os.path.exists(self.outputpath):
-            os.makedirs(self.outputpath)
+        # save files if data is present
+        if 'windows' not in self.output or 'windowlabels' not in self.output:
+            self.logger.warning('No data or labels to save!')
+            return
 
-        # get path
-        if not path:
-            path = self.outputpath
+        if dataset is None:
+            dataset = ShardedDataset(path or self.outputpath)
 
-        # fix path string
-        if not path.endswith('/'): 
-            path += '/'
+        with stage('save'):
+            dataset.append(self.curr_file, self.curr_rm, windows=self.output['windows'], windowlabels=self.output['windowlabels'])
+        self.logger.info(f'Data and labels of {self.curr_file + self.curr_rm} were saved under {dataset.path} ({self.dtype}, {self.label_dtype}).')
 
-        # save files if data is present
-        if 'windows' in self.output:
-            np.savez(path + self.curr_file + self.curr_rm + "_" + suffix[0] + "_0nr.npz", self.output.get('windows'))
-            self.logger.info(f'Data was saved under {path + self.curr_file + self.curr_rm + "_" + suffix[0] + ".npz"}')
-        else:
-            self.logger.warning('No data to save!')
+        self.memory_report()
+
+
+    def memory_report(self) -> dict:
+        """Reports memory and disk usage of the current output compared to storing it as float64.
+        Windows are counted as materialized arrays, i.e. the size they take up in the saved dataset.
+
+        Returns:
+            dict: Per output key ('data', 'windows', 'windowlabels') the dtype, bytes used, bytes as float64 and bytes saved.
+        """
+        report = {}
+
+        for key in ['data', 'windows', 'windowlabels']:
+            if key in self.output:
+                array = self.output[key]
+                nbytes = array.size * array.itemsize
+                baseline = array.size * np.dtype(np.float64).itemsize
+                report[key] = {'dtype': str(array.dtype), 'bytes': nbytes, 'float64_bytes': baseline, 'saved_bytes': baseline - nbytes}
+                self.logger.info(f"{self.curr_file + self.curr_rm} {key}: {nbytes/2**20:.1f} MiB as {array.dtype}, {(baseline - nbytes)/2**20:.1f} MiB saved compared to float64.")
+
+        return report
 
-        if 'windowlabels' in self.output:
-            np.savez(path + self.curr_file + self.curr_rm + "_" + suffix[1] + "_0nr.npz", self.output.get('windowlabels'))
-            self.logger.info(f'Labels were saved under {path + self.curr_file + self.curr_rm + "_" + suffix[1] + ".npz"}')
-        else:
-            self.logger.warning('No labels to save!')
-        
 
     def _test(self):
 
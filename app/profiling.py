@@ -0,0 +1,245 @@
+                         ###################
+                        #                  #
+ #######               #  #  #####  #####  #   ###
+#       #      #      #   #     #      #   #  #   #
+ ###     #    # #    #    #    #      #    #  ####
+    #     #  #   #  #     #   #      #     #  #
+####       ##     ##      #  #####  #####  #   ###
+
+
+#############################################
+#                   IMPORTS                 #
+#############################################
+import contextlib
+import contextvars
+import functools
+import json
+import threading
+import time
+import tracemalloc
+
+
+#############################################
+#                   CONSTANTS               #
+#############################################
+STAGES = ['decode', 'cqt', 'windowing', 'labeling', 'predict', 'postprocess', 'render', 'save']
+
+# profiler and labels (request, file) of the current thread or task, None if profiling is off
+_profiler = contextvars.ContextVar('swizzle_profiler', default=None)
+_labels = contextvars.ContextVar('swizzle_profiler_labels', default={})
+_disabled = contextlib.nullcontext()
+
+
+def stage(name: str):
+    """Context manager that measures a pipeline stage with the active profiler, see Profiler.profile().
+    Without an active profiler it returns a shared no-op context, so instrumented code costs one lookup per stage.
+
+    Args:
+        name (str): Name of the stage, e.g. one of STAGES.
+    """
+    profiler = _profiler.get()
+    return _disabled if profiler is None else profiler.stage(name)
+
+
+def activate(profiler: 'Profiler' = None, **labels):
+    """Activates a profiler for the current context, see Profiler.profile(). Returns a no-op context if profiler is None.
+
+    Args:
+        profiler (Profiler, optional): Profiler to activate. Defaults to None.
+        **labels: Labels of the records (request, file).
+    """
+    return _disabled if profiler is None else profiler.profile(**labels)
+
+
+def profiled(name: str):
+    """Decorator that measures every call of a function as a stage, see stage().
+
+    Args:
+        name (str): Name of the stage, e.g. one of STAGES.
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return fn(*args, **kwargs)
+        return wrapper
+
+    return decorator
+
+
+class Profiler:
+
+    # tracemalloc is process-wide, it runs while any profiler with memory=True is active
+    _tracing = 0
+    _started = False
+    _tracing_lock = threading.Lock()
+
+    # so is its peak, stages measuring memory in all threads as (thread, frame), changed under the lock
+    _open_stages = []
+    _stages_lock = threading.Lock()
+
+    def __init__(self, memory: bool = True) -> None:
+        """Records wall time, CPU time and peak memory of the pipeline stages, labelled by request and file.
+
+        CPU time is the CPU time of the whole process (including the threads of tensorflow) and includes concurrent work
+        in other threads, e.g. other jobs in the frontend. Peak memory is the highest memory allocated through Python
+        (including numpy arrays) above the level at the start of the stage. It is measured process-wide, so stages that
+        overlap a stage of another thread get no peak memory (None) instead of one that includes the other stage.
+
+        Args:
+            memory (bool, optional): Trace peak memory with tracemalloc, which slows down Python allocations. Defaults to True.
+        """
+        self.memory = memory
+        self.records = []
+        self.local = threading.local()
+
+
+    @contextlib.contextmanager
+    def profile(self, request: str = None, file: str = None):
+        """Activates the profiler for the stages run in the current thread inside the context.
+
+        Args:
+            request (str, optional): Label of the request, e.g. a job id. Defaults to None.
+            file (str, optional): Label of the file. Defaults to None.
+        """
+        profiler_token = _profiler.set(self)
+        labels_token = _labels.set({'request': request, 'file': file})
+        if self.memory:
+            self._start_tracing()
+
+        try:
+            yield self
+        finally:
+            if self.memory:
+                self._stop_tracing()
+            _labels.reset(labels_token)
+            _profiler.reset(profiler_token)
+
+
+    @contextlib.contextmanager
+    def stage(self, name: str):
+        """Measures a stage. Stages can be nested, the peak memory of a stage includes the one of its nested stages.
+
+        Args:
+            name (str): Name of the stage, e.g. one of STAGES.
+        """
+        # stack of [memory at start, peak memory, overlapped by another thread] of the open stages of this thread
+        if not hasattr(self.local, 'stack'):
+            self.local.stack = []
+        stack = self.local.stack
+        thread = threading.get_ident()
+
+        tracing = self.memory and tracemalloc.is_tracing()
+        frame = [0, 0, False]
+        if tracing:
+            with Profiler._stages_lock:
+                # the peak of another thread's open stage can't be separated from this one and vice versa
+                if any(t != thread for t, _ in Profiler._open_stages):
+                    frame[2] = True
+                    for _, f in Profiler._open_stages:
+                        f[2] = True
+
+                current, peak = tracemalloc.get_traced_memory()
+                if stack:
+                    stack[-1][1] = max(stack[-1][1], peak)
+                if not frame[2]:
+                    tracemalloc.reset_peak()
+                frame[0] = frame[1] = current
+                Profiler._open_stages.append((thread, frame))
+        stack.append(frame)
+
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+            stack.pop()
+
+            peak_memory = None
+            if tracing:
+                with Profiler._stages_lock:
+                    peak = max(frame[1], tracemalloc.get_traced_memory()[1])
+                    if stack:
+                        stack[-1][1] = max(stack[-1][1], peak)
+                    Profiler._open_stages = [(t, f) for t, f in Profiler._open_stages if f is not frame]
+                if not frame[2]:
+                    peak_memory = peak - frame[0]
+
+            self.records.append({**_labels.get(), 'stage': name, 'wall': wall, 'cpu': cpu, 'peak_memory': peak_memory})
+
+
+    def merge(self, records: list):
+        """Adds records of another profiler, e.g. one that ran in a worker process."""
+        self.records.extend(records)
+
+
+    def summary(self) -> dict:
+        """Returns the number of calls, total wall and CPU time in seconds and the highest peak memory in bytes per stage."""
+        summary = {}
+
+        for record in list(self.records):
+            s = summary.setdefault(record['stage'], {'count': 0, 'wall': 0.0, 'cpu': 0.0, 'peak_memory': None})
+            s['count'] += 1
+            s['wall'] += record['wall']
+            s['cpu'] += record['cpu']
+            if record['peak_memory'] is not None:
+                s['peak_memory'] = max(s['peak_memory'] or 0, record['peak_memory'])
+
+        return summary
+
+
+    def to_json(self) -> str:
+        """Returns the summary per stage and all records (per request and file) as JSON."""
+        return json.dumps({'stages': self.summary(), 'records': list(self.records)}, indent=2)
+
+
+    def to_prometheus(self, prefix: str = 'swizzle') -> str:
+        """Returns the summary per stage in the Prometheus text format. Requests and files are not used as labels to keep the number of series small.
+
+        Args:
+            prefix (str, optional): Prefix of the metric names. Defaults to 'swizzle'.
+        """
+        summary = self.summary()
+        lines = []
+
+        metrics = [('stage_wall_seconds', 'Wall time of pipeline stages.', 'wall'),
+                   ('stage_cpu_seconds', 'CPU time of the process during pipeline stages.', 'cpu')]
+        for metric, description, key in metrics:
+            lines += [f"# HELP {prefix}_{metric} {description}", f"# TYPE {prefix}_{metric} summary"]
+            for name, s in summary.items():
+                lines.append(f'{prefix}_{metric}_sum{{stage="{name}"}} {s[key]:.6f}')
+                lines.append(f'{prefix}_{metric}_count{{stage="{name}"}} {s["count"]}')
+
+        lines += [f"# HELP {prefix}_stage_peak_memory_bytes Highest peak memory of pipeline stages.", f"# TYPE {prefix}_stage_peak_memory_bytes gauge"]
+        for name, s in summary.items():
+            if s['peak_memory'] is not None:
+                lines.append(f'{prefix}_stage_peak_memory_bytes{{stage="{name}"}} {s["peak_memory"]}')
+
+        return "\n".join(lines) + "\n"
+
+
+    def write(self, path: str):
+        """Writes the records as JSON (path ends with .json) or the summary in the Prometheus text format (any other path).
+
+        Args:
+            path (str): Path of the output file.
+        """
+        with open(path, 'w') as f:
+            f.write(self.to_json() if path.endswith('.json') else self.to_prometheus())
+
+
+    def _start_tracing(self):
+        with Profiler._tracing_lock:
+            if Profiler._tracing == 0:
+                # don't stop tracing later if somebody else started it
+                Profiler._started = not tracemalloc.is_tracing()
+                if Profiler._started:
+                    tracemalloc.start()
+            Profiler._tracing += 1
+
+
+    def _stop_tracing(self):
+        with Profiler._tracing_lock:
+            Profiler._tracing -= 1
+            if Profiler._tracing == 0 and Profiler._started:
+                tracemalloc.stop()
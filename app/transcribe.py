@@ -0,0 +1,497 @@
+                         ###################
+                        #                  #
+ #######               #  #  #####  #####  #   ###
+#       #      #      #   #     #      #   #  #   #
+ ###     #    # #    #    #    #      #    #  ####
+    #     #  #   #  #     #   #      #     #  #
+####       ##     ##      #  #####  #####  #   ###
+
+
+#############################################
+#                   IMPORTS                 #
+#############################################
+import numpy as np
+import argparse
+import logging
+import multiprocessing
+import os
+import sys
+import time
+import librosa
+import soundfile as sf
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+from preprocessing.prepro import PreProcessor
+from preprocessing.gate import FrameGate, ENERGY_THRESHOLD, ONSET_THRESHOLD
+from postprocessing.postpro import PostProcessor
+from postprocessing.render import render_text
+from postprocessing.resultcache import ResultCache
+from model.inference import load_model, warmup, MODELPATH, BACKENDS
+from profiling import Profiler, activate, stage
+
+
+#############################################
+#                   CONSTANTS               #
+#############################################
+AUDIOEXTENSIONS = ('.wav', '.flac', '.mp3', '.ogg')
+OUTPUTPATH = '../data/tabs/'
+STREAM_SECONDS = 300        # recordings longer than this are transcribed chunk by chunk
+CHUNK_SECONDS = 30          # length of the chunks
+
+
+def transcribe(audiofile: str, model=None, gate: FrameGate = None, progress=None, cache: ResultCache = None, stream_seconds: float = STREAM_SECONDS,
+               verbose: int = 0) -> np.array:
+    """Transcribes an audio file to tabs. Recordings longer than stream_seconds are streamed (see transcribe_stream()),
+    so memory doesn't grow with their length. Their predictions are not kept for the cache.
+
+    Args:
+        audiofile (str or file-like): Path to the audio file or an open audio file.
+        model (keras.Model or TFLiteModel, optional): Loaded swizzle model. Defaults to None (model is loaded from MODELPATH).
+        gate (FrameGate, optional): Only predict the frames selected by the gate. Defaults to None (every frame is predicted).
+        progress (callable, optional): Called as progress(stage, fraction) when a stage starts, e.g. Job.update. Defaults to None.
+        cache (ResultCache, optional): Cache to look up the tabs in and store them in. Must belong to the model. Defaults to None.
+        stream_seconds (float, optional): Stream recordings longer than this (in seconds). Defaults to 300.
+        verbose (int, optional): Verbosity level of the loggers. Defaults to 0.
+
+    Returns:
+        np.array: Tabs with shape (n, 3) and columns ('position', 'string', 'fret').
+    """
+    progress = progress or (lambda stage, fraction: None)
+
+    p = PreProcessor(verbose=verbose)
+    duration = _duration(audiofile)
+
+    # tabs of the same recording, preprocessing, gate, streaming and model
+    if cache is not None:
+        key = result_key(audiofile, cache, gate, stream_seconds=stream_seconds)
+        tabs = cache.get_tabs(key)
+        if tabs is not None:
+            return tabs
+
+    if model is None:
+        model = load_model()
+
+    if duration is not None and duration > stream_seconds:
+        postpro = PostProcessor(remove_duplicates=True, verbose=verbose)
+        tabs, frames = [], 0
+        progress('predicting', 0.0)
+        for y, _ in _stream_predictions(audiofile, model, gate=gate, verbose=verbose):
+            tabs.append(postpro.feed(y))
+            frames += len(y)
+            progress('predicting', min(frames / (duration * p.sr / p.hop_length), 1.0))
+        tabs.append(postpro.flush())
+        tabs = np.concatenate(tabs)
+
+        if cache is not None:
+            cache.put_tabs(key, tabs)
+
+        return tabs
+
+    # preprocessing
+    progress('loading audio', 0.0)
+    with stage('decode'):
+        audio, _ = librosa.load(audiofile, sr=p.sr, dtype=np.float32, mono=True)
+
+    progress('preprocessing', 0.1)
+    p.preprocess_audio(audio, training=True)
+
+    # prediction
+    progress('predicting', 0.5)
+    with stage('predict'):
+        if gate is None:
+            y_pred = model.predict(p.output['windows'][..., np.newaxis], verbose=0)
+        else:
+            y_pred = gate.predict(model, p.output['data'], p.output['windows'])
+
+    # postprocessing
+    progress('postprocessing', 0.9)
+    tabs = PostProcessor(verbose=verbose).postprocess_data(y_pred, remove_duplicates=True)
+
+    if cache is not None:
+        cache.put_tabs(key, tabs, y_pred)
+
+    return tabs
+
+
+def result_key(audiofile, cache: ResultCache, gate: FrameGate = None, stream_seconds: float = STREAM_SECONDS) -> str:
+    """Returns the key of the tabs of a recording transcribed by transcribe() with the default PreProcessor, see ResultCache.result_key().
+
+    Args:
+        audiofile (str or file-like): Path to the audio file or an open audio file.
+        cache (ResultCache): Cache of the model.
+        gate (FrameGate, optional): Frame gate used for prediction. Defaults to None.
+        stream_seconds (float, optional): Recordings longer than this (in seconds) are streamed. Defaults to 300.
+
+    Returns:
+        str: key of the recording
+    """
+    duration = _duration(audiofile)
+    streamed = duration is not None and duration > stream_seconds
+
+    return cache.result_key(audiofile, PreProcessor(), gate, chunk_seconds=CHUNK_SECONDS if streamed else None)
+
+
+def transcribe_stream(audiofile: str, model, gate: FrameGate = None, chunk_seconds: float = CHUNK_SECONDS, verbose: int = 0):
+    """Transcribes a long recording chunk by chunk. Audio is decoded, preprocessed, predicted and postprocessed
+    per chunk, so tabs are available progressively and memory does not grow with the length of the recording.
+    Without a gate, the tabs of all chunks together are the ones of transcribe(), up to floating point differences of the chunked CQT.
+
+    Args:
+        audiofile (str or file-like): Path to the audio file or an open audio file.
+        model (keras.Model or TFLiteModel): Loaded swizzle model.
+        gate (FrameGate, optional): Only predict the frames selected by the gate, applied to every chunk on its own. Defaults to None.
+        chunk_seconds (float, optional): Length of audio processed at once in seconds. Defaults to 30.
+        verbose (int, optional): Verbosity level of the loggers. Defaults to 0.
+
+    Yields:
+        np.array: Tabs of the next chunk with shape (n, 3) and columns ('position', 'string', 'fret').
+    """
+    postpro = PostProcessor(remove_duplicates=True, verbose=verbose)
+
+    for y, _ in _stream_predictions(audiofile, model, gate=gate, chunk_seconds=chunk_seconds, verbose=verbose):
+        yield postpro.feed(y)
+
+    yield postpro.flush()
+
+
+def _stream_predictions(audiofile: str, model, gate: FrameGate = None, chunk_seconds: float = CHUNK_SECONDS, verbose: int = 0):
+    """Predicts a recording chunk by chunk, see transcribe_stream(). The gate only sees the frames of the current chunk,
+    so its thresholds are relative to the loudest frame and the strongest onset of the chunk instead of the whole recording.
+
+    Yields:
+        tuple: predictions of all frames of the next chunk with shape (TIME, STRINGS, CLASSES), number of predicted frames
+    """
+    p = PreProcessor(verbose=verbose)
+
+    for windows in p.stream_audio(audiofile, training=True, chunk_seconds=chunk_seconds):
+        with stage('predict'):
+            if gate is None:
+                y, predicted = model.predict(windows[..., np.newaxis], verbose=0), len(windows)
+            else:
+                # the center column of a window is its own CQT frame
+                selected, active = gate.select(windows[:, :, p.winwidth//2])
+                y = model.predict(windows[selected][..., np.newaxis], verbose=0) if selected.any() else np.zeros((0, *model.output_shape[1:]), dtype=np.float32)
+                y, predicted = gate.expand(y, selected, active), int(selected.sum())
+        yield y, predicted
+
+
+def _duration(audiofile) -> float:
+    """Returns the length of a recording in seconds without decoding it, or None if soundfile can't read the format.
+    The position of open files is not changed.
+    """
+    position = audiofile.tell() if hasattr(audiofile, 'tell') else None
+    try:
+        with sf.SoundFile(audiofile) as f:
+            return f.frames / f.samplerate
+    except RuntimeError:
+        return None
+    finally:
+        if position is not None:
+            audiofile.seek(position)
+
+
+def find_audiofiles(inputs: list) -> list:
+    """Collects audio files from a list of files, directories (searched recursively) and text files listing one path per line.
+
+    Args:
+        inputs (list): Paths to audio files, directories or .txt file lists.
+
+    Returns:
+        list: Sorted paths of audio files.
+    """
+    audiofiles = []
+
+    for path in inputs:
+        if os.path.isdir(path):
+            for root, _, files in os.walk(path):
+                audiofiles += [os.path.join(root, f) for f in files if f.lower().endswith(AUDIOEXTENSIONS)]
+        elif path.endswith('.txt'):
+            with open(path) as f:
+                audiofiles += [line.strip() for line in f if line.strip()]
+        else:
+            audiofiles.append(path)
+
+    return sorted(set(audiofiles))
+
+
+def output_names(audiofiles: list, outputpath: str) -> dict:
+    """Maps audio files to the names of their tabs (without extension). The directory structure of the inputs is
+    mirrored relative to their common root, so files with the same name in different directories don't overwrite each other.
+
+    Args:
+        audiofiles (list): Paths to the audio files.
+        outputpath (str): Directory for the tabs.
+
+    Raises:
+        ValueError: If two audio files would be written to the same tabs (e.g. take1.wav and take1.mp3 in one directory).
+
+    Returns:
+        dict: Output name per audio file.
+    """
+    if not audiofiles:
+        return {}
+
+    root = os.path.commonpath([os.path.dirname(os.path.abspath(f)) for f in audiofiles])
+    names = {f: os.path.join(outputpath, os.path.splitext(os.path.relpath(os.path.abspath(f), root))[0]) for f in audiofiles}
+
+    seen = {}
+    for audiofile, name in names.items():
+        if name in seen:
+            raise ValueError(f"{seen[name]} and {audiofile} would both be written to {name}.txt, rename one of them.")
+        seen[name] = audiofile
+
+    return names
+
+
+def transcribe_batch(audiofiles: list, model, outputpath: str = OUTPUTPATH, batch_size: int = 512, workers: int = None, gate: FrameGate = None,
+                     profiler: Profiler = None, stream_seconds: float = STREAM_SECONDS, verbose: int = 0) -> dict:
+    """Transcribes many audio files. Preprocessing runs in a process pool, windows of all files are packed into
+    fixed-size batches for the model and the predictions are split back per file for postprocessing.
+    Tabs of a file are written as soon as all of its windows are predicted. Files longer than stream_seconds are
+    streamed one after the other in the main process afterwards (see transcribe_stream()), so memory doesn't grow with their length.
+
+    Args:
+        audiofiles (list): Paths to the audio files.
+        model (keras.Model or TFLiteModel): Loaded swizzle model.
+        outputpath (str, optional): Directory for the tabs (<name>.txt as ASCII tabs, <name>.csv with position, string, fret), mirroring the
+            directories of the audio files relative to their common root. Defaults to '../data/tabs/'.
+        batch_size (int, optional): Number of windows per prediction batch. Defaults to 512.
+        workers (int, optional): Number of preprocessing processes. Defaults to None (number of CPUs).
+        gate (FrameGate, optional): Only predict the frames selected by the gate. Defaults to None (every frame is predicted).
+        profiler (Profiler, optional): Profiler to record the stages of all files in, including the ones run in worker processes. Defaults to None.
+        stream_seconds (float, optional): Stream files longer than this (in seconds). Defaults to 300.
+        verbose (int, optional): Verbosity level of the loggers. Defaults to 0.
+
+    Raises:
+        ValueError: If two audio files would be written to the same tabs.
+
+    Returns:
+        dict: number of files, windows and predicted windows, time in seconds, files/sec and windows/sec, paths of the files that failed.
+    """
+    # setup logger
+    FORMAT = "[%(levelname)8s][%(filename)s:%(lineno)4s - %(funcName)20s() ] %(message)s"
+    logging.basicConfig(format=FORMAT)
+    verbosity = {0: logging.CRITICAL, 1: logging.ERROR, 2: logging.WARNING, 3: logging.INFO, 4: logging.DEBUG}
+    logger = logging.getLogger(__name__)
+    logger.setLevel(verbosity[verbose])
+
+    # fail before any work is done
+    names = output_names(audiofiles, outputpath)
+    for name in set(names.values()):
+        os.makedirs(os.path.dirname(name) or '.', exist_ok=True)
+
+    # long files would hold their whole CQT and windows in memory
+    durations = {audiofile: _duration(audiofile) for audiofile in audiofiles}
+    streamed = [audiofile for audiofile in audiofiles if durations[audiofile] is not None and durations[audiofile] > stream_seconds]
+    if streamed:
+        logger.info(f"Streaming {len(streamed)} files longer than {stream_seconds}s.")
+
+    workers = workers or os.cpu_count()
+    p = PreProcessor(verbose=verbose)
+    postpro = PostProcessor(verbose=verbose)
+
+    # fixed-size batch buffer, filled with windows of one or more files
+    batch = np.zeros((batch_size, *model.input_shape[1:]), dtype=np.float32)
+    slots = []          # (file, first window of file, number of windows, position in batch)
+    fill = 0
+    pending = {}        # predictions of files not finished yet
+    stats = {'files': 0, 'windows': 0, 'predicted': 0, 'predict': 0, 'failed': []}
+
+    def fail(audiofile, e):
+        # files fail on their own, the others are still transcribed
+        logger.error(f"Transcribing {audiofile} failed: {e!r}")
+        stats['failed'].append(audiofile)
+        pending.pop(audiofile, None)
+
+    def write(audiofile, tabs):
+        name = names[audiofile]
+        with activate(profiler, file=audiofile):
+            text = render_text(tabs)
+        with open(name + '.txt', 'w') as f:
+            f.write(text)
+        np.savetxt(name + '.csv', np.reshape(tabs, (-1, 3)), fmt='%d', delimiter=',', header='position,string,fret', comments='')
+        stats['files'] += 1
+        logger.info(f"[{stats['files']}/{len(audiofiles)}] Wrote tabs of {audiofile} ({len(tabs)} notes).")
+
+    def finish(audiofile):
+        try:
+            result = pending.pop(audiofile)
+            y = result['y'] if gate is None else gate.expand(result['y'], result['selected'], result['active'])
+            with activate(profiler, file=audiofile):
+                tabs = postpro.postprocess_data(y, remove_duplicates=True)
+            write(audiofile, tabs)
+        except Exception as e:
+            fail(audiofile, e)
+
+    def predict():
+        start = time.perf_counter()
+        try:
+            with activate(profiler), stage('predict'):
+                y = model.predict_on_batch(batch)
+        except Exception as e:
+            # every file with windows in the batch fails
+            for audiofile in dict.fromkeys(slot[0] for slot in slots if slot[0] in pending):
+                fail(audiofile, e)
+            slots.clear()
+            return
+        finally:
+            stats['predict'] += time.perf_counter() - start
+
+        for audiofile, first, count, pos in slots:
+            # windows of a file that failed in an earlier batch
+            if audiofile not in pending:
+                continue
+            pending[audiofile]['y'][first:first + count] = y[pos:pos + count]
+            pending[audiofile]['done'] += count
+            if pending[audiofile]['done'] == len(pending[audiofile]['y']):
+                finish(audiofile)
+        slots.clear()
+
+    start = time.perf_counter()
+
+    # workers are spawned, forking a process that already runs tensorflow (the model) can deadlock them
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+
+        # keep at most 2 files per worker in flight, so preprocessed files don't pile up in memory
+        queue = [audiofile for audiofile in reversed(audiofiles) if audiofile not in streamed]
+        running = {}
+
+        while queue or running:
+            while queue and len(running) < 2 * workers:
+                audiofile = queue.pop()
+                running[executor.submit(_preprocess, p, audiofile, profiler is not None)] = audiofile
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                audiofile = running.pop(future)
+                try:
+                    audiofile, data, records = future.result()
+                except Exception as e:
+                    fail(audiofile, e)
+                    continue
+
+                if profiler is not None:
+                    profiler.merge(records)
+
+                with activate(profiler, file=audiofile):
+                    p._get_windows(data, training=True)
+                windows = p.output['windows']
+                pending[audiofile] = {'done': 0}
+                stats['windows'] += len(windows)
+
+                # only pack the windows of frames selected by the gate
+                if gate is not None:
+                    pending[audiofile]['selected'], pending[audiofile]['active'] = gate.select(data)
+                    windows = windows[pending[audiofile]['selected']]
+
+                pending[audiofile]['y'] = np.zeros((len(windows), *model.output_shape[1:]), dtype=np.float32)
+                stats['predicted'] += len(windows)
+
+                if len(windows) == 0:
+                    finish(audiofile)
+
+                # pack windows into the batch, predict whenever it is full
+                first = 0
+                while first < len(windows):
+                    count = min(len(windows) - first, batch_size - fill)
+                    batch[fill:fill + count] = windows[first:first + count].reshape(count, *batch.shape[1:])
+                    slots.append((audiofile, first, count, fill))
+                    fill += count
+                    first += count
+
+                    if fill == batch_size:
+                        predict()
+                        fill = 0
+
+                    # the rest of the windows of a file whose batch failed isn't packed
+                    if audiofile not in pending:
+                        break
+
+    # last, partially filled batch (padded with zeros to keep the batch shape fixed)
+    if fill:
+        batch[fill:] = 0
+        predict()
+
+    # long files chunk by chunk, tabs continue across the chunks of a file
+    for audiofile in streamed:
+        tabs = []
+        start_predict = time.perf_counter()
+        try:
+            with activate(profiler, file=audiofile):
+                for y, predicted in _stream_predictions(audiofile, model, gate=gate, verbose=verbose):
+                    tabs.append(postpro.feed(y))
+                    stats['windows'] += len(y)
+                    stats['predicted'] += predicted
+            write(audiofile, np.concatenate(tabs + [postpro.flush()]))
+        except Exception as e:
+            postpro.flush()
+            fail(audiofile, e)
+        finally:
+            stats['predict'] += time.perf_counter() - start_predict
+
+    elapsed = time.perf_counter() - start
+    stats.update({'time': elapsed, 'files_per_sec': stats['files'] / elapsed, 'windows_per_sec': stats['windows'] / elapsed})
+    logger.info(f"Transcribed {stats['files']} files ({stats['windows']} windows, {stats['predicted']} predicted) in {elapsed:.1f}s: "
+                f"{stats['files_per_sec']:.2f} files/sec, {stats['windows_per_sec']:.0f} windows/sec, {stats['predict']:.1f}s in predict.")
+    if stats['failed']:
+        logger.error(f"{len(stats['failed'])} of {len(audiofiles)} files failed: {', '.join(stats['failed'])}")
+
+    return stats
+
+
+def _preprocess(p: PreProcessor, audiofile: str, profile: bool = False):
+    """Loads an audio file and calculates its CQT. Executed in a worker process.
+    Only the CQT frames are returned, windows are built in the main process as views on them.
+    With profile, the records of the decode and cqt stages are returned as well.
+    """
+    profiler = Profiler() if profile else None
+
+    with activate(profiler, file=audiofile):
+        with stage('decode'):
+            audio, _ = librosa.load(audiofile, sr=p.sr, dtype=np.float32, mono=True)
+        p.preprocess_audio(audio, training=True)
+
+    return audiofile, np.ascontiguousarray(p.output['data']), profiler.records if profile else []
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Transcribe guitar recordings to tabs.")
+    parser.add_argument("inputs", nargs='+', help="audio files, directories (searched recursively) or .txt files listing audio files")
+    parser.add_argument("--output", default=OUTPUTPATH, help=f"directory for the tabs (default: {OUTPUTPATH})")
+    parser.add_argument("--model", default=MODELPATH, help=f"path to the swizzle model (default: {MODELPATH})")
+    parser.add_argument("--backend", default='keras', choices=BACKENDS, help="inference backend (default: keras)")
+    parser.add_argument("--batch-size", type=int, default=512, help="windows per prediction batch (default: 512)")
+    parser.add_argument("--workers", type=int, default=None, help="preprocessing processes (default: number of CPUs)")
+    parser.add_argument("--gate", action='store_true', help="skip prediction of silent and sustained frames")
+    parser.add_argument("--gate-energy", type=float, default=ENERGY_THRESHOLD, help=f"frames quieter than this (dB below the loudest frame) are silent (default: {ENERGY_THRESHOLD})")
+    parser.add_argument("--gate-onset", type=float, default=ONSET_THRESHOLD, help=f"onset strength threshold in [0, 1], lower predicts more frames (default: {ONSET_THRESHOLD})")
+    parser.add_argument("--stream-seconds", type=float, default=STREAM_SECONDS, help=f"stream files longer than this, chunk by chunk (default: {STREAM_SECONDS})")
+    parser.add_argument("--profile", default=None, metavar="PATH", help="write wall time, CPU time and peak memory per stage to PATH (.json, otherwise Prometheus text format)")
+    parser.add_argument("--verbose", type=int, default=3, help="verbosity of the loggers (0-4, default: 3)")
+    args = parser.parse_args()
+
+    audiofiles = find_audiofiles(args.inputs)
+
+    model = load_model(args.model, backend=args.backend)
+    warmup(model, batch_size=args.batch_size)
+
+    gate = FrameGate(args.gate_energy, args.gate_onset, verbose=args.verbose) if args.gate else None
+
+    profiler = Profiler() if args.profile else None
+
+    stats = transcribe_batch(audiofiles, model, outputpath=args.output, batch_size=args.batch_size, workers=args.workers, gate=gate, profiler=profiler,
+                             stream_seconds=args.stream_seconds, verbose=args.verbose)
+
+    if profiler is not None:
+        profiler.write(args.profile)
+    print(f"{stats['files']} files, {stats['windows']} windows ({stats['predicted']} predicted) in {stats['time']:.1f}s: {stats['files_per_sec']:.2f} files/sec, {stats['windows_per_sec']:.0f} windows/sec")
+
+    if stats['failed']:
+        print(f"{len(stats['failed'])} files failed:", *stats['failed'], sep="\n  ")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()